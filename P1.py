@@ -1,5 +1,8 @@
 # coding: utf-8
 
+# First exported from P1.ipynb, which keeps that version with its outputs. The code has since been developed
+# here and in lane_core.py only; the notebook text below is kept for the demo cells it introduces.
+
 # # Self-Driving Car Engineer Nanodegree
 #
 #
@@ -46,8 +49,7 @@
 
 
 # importing some useful packages
-import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
+# matplotlib, moviepy and IPython are only imported by the cells that use them, so that importing P1 stays light
 import numpy as np
 import cv2
 
@@ -60,10 +62,13 @@ import cv2
 
 
 # reading in an image
-image = mpimg.imread('test_images/solidWhiteRight.jpg')
+if __name__ == '__main__':
+    import matplotlib.image as mpimg
+
+    image = mpimg.imread('test_images/solidWhiteRight.jpg')
 
-# printing out some stats and plotting
-print('This image is:', type(image), 'with dimensions:', image.shape)
+    # printing out some stats and plotting
+    print('This image is:', type(image), 'with dimensions:', image.shape)
 # plt.imshow(
 #     image)  # if you wanted to show a single color channel image called 'gray', for example, call as plt.imshow(gray, cmap='gray')
 
@@ -88,338 +93,142 @@ print('This image is:', type(image), 'with dimensions:', image.shape)
 # In[3]:
 
 
-import math
-
-
-def grayscale(img):
-    """Applies the Grayscale transform
-    This will return an image with only one color channel
-    but NOTE: to see the returned image as grayscale
-    (assuming your grayscaled image is called 'gray')
-    you should call plt.imshow(gray, cmap='gray')"""
-    return cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-    # Or use BGR2GRAY if you read an image with cv2.imread()
-    # return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-
-
-def canny(img, low_threshold, high_threshold):
-    """Applies the Canny transform"""
-    return cv2.Canny(img, low_threshold, high_threshold)
-
+# The helper functions, and the lane finding pipeline built from them below, are in lane_core.py, which only needs
+# numpy and OpenCV, so that tools and worker processes import them without the notebook's dependencies.
+import os
+import time
 
-def gaussian_blur(img, kernel_size):
-    """Applies a Gaussian Noise kernel"""
-    return cv2.GaussianBlur(img, (kernel_size, kernel_size), 0)
+from lane_core import *
 
 
-def region_of_interest(img, vertices):
-    """
-    Applies an image mask.
+# ## Test Images
+#
+# Build your pipeline to work on the images in the directory "test_images"
+# **You should make sure your pipeline works well on these images before you try the videos.**
 
-    Only keeps the region of the image defined by the polygon
-    formed from `vertices`. The rest of the image is set to black.
-    """
-    # defining a blank mask to start with
-    mask = np.zeros_like(img)
+# In[4]:
 
-    # defining a 3 channel or 1 channel color to fill the mask with depending on the input image
-    if len(img.shape) > 2:
-        channel_count = img.shape[2]  # i.e. 3 or 4 depending on your image
-        ignore_mask_color = (255,) * channel_count
-    else:
-        ignore_mask_color = 255
 
-    # filling pixels inside the polygon defined by "vertices" with the fill color
-    cv2.fillPoly(mask, vertices, ignore_mask_color)
+if __name__ == '__main__':
+    print(os.listdir("test_images/"))
 
-    # returning the image only where mask pixels are nonzero
-    masked_image = cv2.bitwise_and(img, mask)
-    return masked_image
 
+# ## Build a Lane Finding Pipeline
+#
+#
 
-def draw_lines(img, lines, color=[255, 0, 0], thickness=5):
-    """
-    NOTE: this is the function you might want to use as a starting point once you want to
-    average/extrapolate the line segments you detect to map out the full
-    extent of the lane (going from the result shown in raw-lines-example.mp4
-    to that shown in P1_example.mp4).
-
-    Think about things like separating line segments by their
-    slope ((y2-y1)/(x2-x1)) to decide which segments are part of the left
-    line vs. the right line.  Then, you can average the position of each of
-    the lines and extrapolate to the top and bottom of the lane.
-
-    This function draws `lines` with `color` and `thickness`.
-    Lines are drawn on the image inplace (mutates the image).
-    If you want to make the lines semi-transparent, think about combining
-    this function with the weighted_img() function below
-    """
-    for line in lines:
-        for x1, y1, x2, y2 in line:
-            cv2.line(img, (x1, y1), (x2, y2), color, thickness)
-
-
-prev_pos_slopes = []
-prev_pos_x_mids = []
-prev_neg_slopes = []
-prev_neg_x_mids = []
-prev_size = 15 # keep past slopes and x_mids
-
-
-def moving_averages(new_slope, new_x_mid, index):
-    global prev_pos_slopes, prev_pos_x_mids, prev_neg_slopes, prev_neg_x_mids, prev_size
-    if index == 'pos':
-        prev_slopes = prev_pos_slopes
-        prev_x_mids = prev_pos_x_mids
-    else:
-        prev_slopes = prev_neg_slopes
-        prev_x_mids = prev_neg_x_mids
-    prev_slope_sum = np.sum(prev_slopes)
-    prev_x_mid_sum = np.sum(prev_x_mids)
-    mavg_slope = (prev_slope_sum + new_slope) / (len(prev_slopes) + 1)
-    mavg_x_mid = (prev_x_mid_sum + new_x_mid) / (len(prev_x_mids) + 1)
-    prev_slopes.append(new_slope)
-    prev_x_mids.append(new_x_mid)
-    if len(prev_slopes) > prev_size:
-        prev_slopes.pop(0)
-        prev_x_mids.pop(0)
-    return mavg_slope, mavg_x_mid
-
-
-def clear_moving_averages():
-    global prev_pos_slopes, prev_pos_x_mids, prev_neg_slopes, prev_neg_x_mids, prev_size
-    prev_pos_slopes = []
-    prev_pos_x_mids = []
-    prev_neg_slopes = []
-    prev_neg_x_mids = []
-
-
-def hough_lines(img, rho, theta, threshold, min_line_len, max_line_gap):
-    """
-    `img` should be the output of a Canny transform.
+# Build the pipeline and run your solution on all test_images. Make copies into the `test_images_output` directory, and you can use the images in your writeup report.
+#
+# Try tuning the various parameters, especially the low and high Canny thresholds as well as the Hough lines parameters.
 
-    Returns an image with hough lines drawn.
-    """
-    lines = cv2.HoughLinesP(img, rho, theta, threshold, np.array([]), minLineLength=min_line_len,
-                            maxLineGap=max_line_gap)
-    line_img = np.zeros((img.shape[0], img.shape[1], 3), dtype=np.uint8)
-    lines_new = []
-    pos_slopes = []
-    pos_intercepts = []
-    pos_sq_distances = np.zeros([len(lines)])
-    neg_slopes = []
-    neg_intercepts = []
-    neg_sq_distances = np.zeros([len(lines)])
-    pos_len = 0
-    neg_len = 0
-    y_mid = img.shape[0] * 3/4
-    min_pos_slope = 0.5
-    max_pos_slope = 0.8
-    min_neg_slope = -0.8
-    max_neg_slope = -0.5
-    min_abs_slope = 0.01  # to ignore almost vertical lines
-    pos_x_mids = []
-    neg_x_mids = []
-    if not lines is None: # sometime no lines are detected and lines becomes None
-        # eliminate lines that are outside slope limits specified
-        # calculate intercepts at y_mid within roi: at 3/4 down from top of image
-        for line in lines:
-            for x1, y1, x2, y2 in line:
-                if x2 != x1:
-                    slope = (y2-y1)/(x2-x1)
-                    if math.fabs(slope) < min_abs_slope:
-                        continue   # ignore almost vertical lines
-                    intercept = y2 - slope * x2
-                    x_mid = (y_mid - intercept) / slope
-                    sq_distance = (y2 - y1) * (y2 - y1) + (x2 - x1) * (x2 - x1)
-                    # print("line: slope={:.2f}, x_mid={:.2f}, intercept={:.2f}:({:.2f},{:.2f})-({:.2f},{:.2f})".format(
-                    #         slope, x_mid, intercept, x1, y1, x2, y2))
-                    if (slope >= min_pos_slope) and (slope <= max_pos_slope):
-                        pos_slopes.append(slope)
-                        pos_intercepts.append(intercept)
-                        pos_sq_distances[pos_len] = sq_distance
-                        pos_x_mids.append(x_mid)
-                        pos_len += 1
-                        # print('Appended slope = {:.2f}'.format(slope))
-                    elif (slope <= max_neg_slope) and (slope >= min_neg_slope):
-                        neg_slopes.append(slope)
-                        neg_intercepts.append(intercept)
-                        neg_sq_distances[neg_len] = sq_distance
-                        neg_x_mids.append(x_mid)
-                        neg_len += 1
-                        # print('Appended slope = {:.2f}'.format(slope))
-                    else:
-                        # print('Excluded line with slope = {:.2f}'.format(slope))
-                        pass
-
-        # print('Pos slopes:', pos_slopes)
-        # print('Pos x_mids:', pos_x_mids)
-        # print('Pos intercepts:', pos_intercepts)
-        # print('Neg slopes:', neg_slopes)
-        # print('Neg x_mids:', neg_x_mids)
-        # print('Neg intercepts:', neg_intercepts)
-        pos_len = len(pos_slopes)
-        y1 = img.shape[0] - 1
-        y2 = int(img.shape[0]*5/8)
-        if pos_len > 0:
-            # # # pos_median_index = np.argsort(pos_slopes)[len(pos_slopes) // 2]
-            # # pos_mid1 = pos_slopes.index(np.percentile(pos_slopes, 25, interpolation='nearest'))
-            # # pos_mid2 = pos_slopes.index(np.percentile(pos_slopes, 75, interpolation='nearest'))
-            # pos_sq_distance_max_index = pos_sq_distances.argmax()
-            # # # pos_slope = pos_slopes[neg_median_index]
-            # # pos_slope = np.average(pos_slopes[pos_mid1:pos_mid2+1])
-            # pos_slope = pos_slopes[pos_sq_distance_max_index]
-            # # # pos_intercept = pos_intercepts[pos_median_index]
-            # # pos_intercept = np.average(pos_intercepts[pos_mid1:pos_mid2+1])
-            # pos_intercept = pos_intercepts[pos_sq_distance_max_index]
-            pos_slope = np.average(pos_slopes)
-            pos_x_mid = np.average(pos_x_mids)
-            # pos_intercept = np.average(pos_intercepts)
-            pos_slope, pos_x_mid = moving_averages(pos_slope, pos_x_mid, 'pos')
-            pos_intercept = y_mid - pos_slope * pos_x_mid
-            x1 = int((y1 - pos_intercept)/pos_slope)
-            x2 = int((y2 - pos_intercept)/pos_slope)
-            lines_new.append([[x1, y1, x2, y2]])
-            # print("pos laneline: slope={:.2f}, x_mid={:.2f}, intercept={:.2f}:({:.2f},{:.2f})-({:.2f},{:.2f})".format(
-            #     pos_slope, pos_x_mid, pos_intercept, x1,y1,x2,y2))
-        neg_len = len(neg_slopes)
-        if neg_len > 0:
-            # # # neg_median_index = np.argsort(neg_slopes)[len(neg_slopes) // 2]
-            # # neg_mid1 = neg_slopes.index(np.percentile(neg_slopes, 25, interpolation='nearest'))
-            # # neg_mid2 = neg_slopes.index(np.percentile(neg_slopes, 75, interpolation='nearest'))
-            # neg_sq_distance_max_index = neg_sq_distances.argmax()
-            # # # neg_slope = neg_slopes[neg_median_index]
-            # # neg_slope = np.average(neg_slopes[neg_mid1:neg_mid2+1])
-            # neg_slope = neg_slopes[neg_sq_distance_max_index]
-            # # # neg_intercept = neg_intercepts[neg_median_index]
-            # # neg_intercept = np.average(neg_slopes[neg_mid1:neg_mid2+1])
-            # neg_intercept = neg_intercepts[neg_sq_distance_max_index]
-            neg_slope = np.average(neg_slopes)
-            neg_x_mid = np.average(neg_x_mids)
-            neg_slope, neg_x_mid = moving_averages(neg_slope, neg_x_mid, 'neg')
-            # neg_intercept = np.average(neg_intercepts)
-            neg_intercept = y_mid - neg_slope * neg_x_mid
-            x1 = int((y1 - neg_intercept)/neg_slope)
-            x2 = int((y2 - neg_intercept)/neg_slope)
-            lines_new.append([[x1, y1, x2, y2]])
-            # print("neg laneline: slope={:.2f}, x_mid={:.2f}, intercept={:.2f}:({:.2f},{:.2f})-({:.2f},{:.2f})".format(
-            #     neg_slope, neg_x_mid, neg_intercept, x1,y1,x2,y2))
-
-
-        draw_lines(line_img, lines_new)
-        # cv2.imshow('before_lines', img)
-        # temp = np.zeros((img.shape[0], img.shape[1], 3), dtype=np.uint8)
-        # draw_lines(temp, lines)
-        # cv2.imshow('lines_original', temp)
-        # temp2 = np.zeros((img.shape[0], img.shape[1], 3), dtype=np.uint8)
-        # draw_lines(temp2, lines_new)
-        # cv2.imshow('lane_lines', temp2)
-        # cv2.waitKey(1000)
-    return line_img
-
-
-# Python 3 has support for cool math symbols.
-
-def weighted_img(img, initial_img, α=0.8, β=1., γ=0.):
-    """
-    `img` is the output of the hough_lines(), An image with lines drawn on it.
-    Should be a blank image (all black) with lines drawn on it.
+# In[8]:
 
-    `initial_img` should be the image before any processing.
 
-    The result image is computed as follows:
+# The pipeline is defined in lane_core.py: lane_roi_vertices, lane_edge_band, hough_segments and
+# lane_finding_pipeline, and LaneFindingPipeline with its buffers, StageProfiler and RealTimePipeline.
 
-    initial_img * α + img * β + γ
-    NOTE: initial_img and img must be the same shape!
-    """
-    return cv2.addWeighted(initial_img, α, img, β, γ)
+IMAGE_DIR = "test_images/"
+if __name__ == '__main__':
+    # headless: write the results and their lane lines to test_images_output instead of showing them
+    from process_images import find_images, process_images
+    process_images(find_images([IMAGE_DIR]), 'test_images_output')
 
 
-# ## Test Images
+# ## Benchmark Segment Fitting
 #
-# Build your pipeline to work on the images in the directory "test_images"
-# **You should make sure your pipeline works well on these images before you try the videos.**
-
-# In[4]:
+# `hough_lines` classifies and averages all Hough segments of a frame at once in `fit_lane_segments`.
+# Record the segments found in the test images and compare its runtime against the per-segment loop.
 
+# In[ ]:
 
-import os
 
-os.listdir("test_images/")
+def record_segment_sets(image_dir, params=default_parameters):
+    """
+    Returns a list of (lines, y_mid) for the jpg images in `image_dir`, where
+    `lines` are the HoughLinesP segments found with LaneParameters `params`.
+    """
+    segment_sets = []
+    for imagefile in sorted(os.listdir(image_dir)):
+        if imagefile.split('.')[-1] == 'jpg':
+            image = cv2.imread(os.path.join(image_dir, imagefile))
+            lines = hough_segments(*lane_edge_band(image, params), params)
+            segment_sets.append((lines, image.shape[0] * 3/4))
+    return segment_sets
 
 
-# ## Build a Lane Finding Pipeline
-#
+def benchmark_segment_fitting(segment_sets, repeat=200):
+    """
+    Times fit_lane_segments() against fit_lane_segments_loop() over `segment_sets`
+    and checks that both give the same lane fits.
+    """
+    for lines, y_mid in segment_sets:
+        assert fit_lane_segments(lines, y_mid) == fit_lane_segments_loop(lines, y_mid)
+    n_segments = sum(0 if lines is None else len(lines) for lines, _ in segment_sets)
+    runtimes = {}
+    for fit in (fit_lane_segments_loop, fit_lane_segments):
+        tic = time.perf_counter()
+        for _ in range(repeat):
+            for lines, y_mid in segment_sets:
+                fit(lines, y_mid)
+        runtimes[fit.__name__] = (time.perf_counter() - tic) / (repeat * len(segment_sets))
+        print('{}: {:.1f} us per frame ({} frames, {} segments)'.format(
+            fit.__name__, runtimes[fit.__name__] * 1e6, len(segment_sets), n_segments))
+    return runtimes
+
+
+if __name__ == '__main__':
+    benchmark_segment_fitting(record_segment_sets(IMAGE_DIR))
+
+
+# ## Benchmark Buffer Reuse
 #
+# `LaneFindingPipeline` keeps its buffers from frame to frame. Compare its frame time and the memory it allocates
+# per frame against `lane_finding_pipeline`.
 
-# Build the pipeline and run your solution on all test_images. Make copies into the `test_images_output` directory, and you can use the images in your writeup report.
-#
-# Try tuning the various parameters, especially the low and high Canny thresholds as well as the Hough lines parameters.
+# In[ ]:
 
-# In[8]:
 
+import tracemalloc
 
-# TODO: Build your pipeline that will draw lane lines on the test_images
-# then save them to the test_images_output directory.
-def lane_finding_pipeline(image):
-    # get gray scale first since all processing steps are on grayscale only
-    gray = grayscale(image)
-    # Define a kernel size and apply Gaussian smoothing
-    kernel_size = 5
-    blur_gray = gaussian_blur(gray, kernel_size)
-    # Define our parameters for Canny and apply
-    low_threshold = 60
-    high_threshold = 120
-    edges = canny(blur_gray, low_threshold, high_threshold)
-    # cv2.imshow('edges', edges)
-    # cv2.waitKey(1000)
-    # Next we'll create a masked edges image using cv2.fillPoly()
-    mask = np.zeros_like(edges)
-    ignore_mask_color = 255
-    # This time we are defining a four sided polygon to mask
-    imshape = image.shape
-    vertices = np.array([[(int(imshape[1]*1/16), int(imshape[0])),
-                          (int(imshape[1] * 7 / 16), int(imshape[0] * 5 / 8)),
-                          (int(imshape[1] * 9 / 16), int(imshape[0] * 5 / 8)),
-                          (int(imshape[1]*15/16), int(imshape[0]))]],
-                        dtype=np.int32)
-    cv2.fillPoly(mask, vertices, ignore_mask_color)
-    # cv2.imshow('mask', mask)
-    # cv2.waitKey(1000)
-    masked_edges = cv2.bitwise_and(edges, mask)
-    # cv2.imshow('masked_edges', masked_edges)
-    # cv2.waitKey(1000)
-    # Define the Hough transform parameters
-    # Make a blank the same size as our image to draw on
-    rho = 2
-    theta = np.pi / 180
-    threshold = 50
-    min_line_length = 25
-    max_line_gap = 100
-    # Run Hough on edge detected image
-    line_image = hough_lines(masked_edges, rho, theta, threshold,
-                             min_line_length, max_line_gap)
-    # cv2.imshow('line_image', line_image)
-    # cv2.waitKey(1000)
-    # # Create a "color" binary image to combine with line image
-    # color_edges = np.dstack((masked_edges, masked_edges, masked_edges))
-    # cv2.imshow('color_edges', color_edges)
-    # cv2.waitKey(1000)
-    # Draw the lines on the edge image
-    combo = weighted_img(line_image, image, 0.8, 1, 0)
-    # cv2.imshow('combo', combo)
-    # cv2.waitKey(1000)
-    return combo
 
-IMAGE_DIR = "test_images/"
-for imagefile in os.listdir(IMAGE_DIR):
-    if imagefile.split('.')[-1] == 'jpg':
-        image = cv2.imread(os.path.join(IMAGE_DIR, imagefile))
-        cv2.imshow('image', image)
-        result = lane_finding_pipeline(image)
-        cv2.imshow('result', result)
-        cv2.waitKey(3000)
-        clear_moving_averages()
+def benchmark_pipelines(frames, repeat=5):
+    """
+    Times lane_finding_pipeline() against LaneFindingPipeline (writing to a
+    new frame, and to a reused output frame) over `frames` of the same size,
+    checks that they give the same output and reports the peak memory
+    allocated while processing a frame.
+    """
+    results = {}
+    buffered = LaneFindingPipeline()
+    out = np.empty_like(frames[0])
+    tracker = LaneTracker()
+    for frame in frames:
+        assert np.array_equal(lane_finding_pipeline(frame, tracker), buffered(frame))
+    pipelines = [('lane_finding_pipeline', lambda frame: lane_finding_pipeline(frame, tracker)),
+                 ('LaneFindingPipeline', lambda frame: buffered(frame)),
+                 ('LaneFindingPipeline reusing output', lambda frame: buffered(frame, out=out))]
+    for name, pipeline in pipelines:
+        tic = time.perf_counter()
+        for _ in range(repeat):
+            for frame in frames:
+                pipeline(frame)
+        runtime = (time.perf_counter() - tic) / (repeat * len(frames))
+        peak = 0
+        tracemalloc.start()
+        for frame in frames:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            pipeline(frame)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+        tracemalloc.stop()
+        results[name] = (runtime, peak)
+        print('{}: {:.2f} ms per frame, {:.0f} kB peak allocation per frame'.format(name, runtime * 1e3, peak / 1024))
+    return results
+
+
+if __name__ == '__main__':
+    benchmark_pipelines([cv2.imread(os.path.join(IMAGE_DIR, imagefile)) for imagefile in sorted(os.listdir(IMAGE_DIR))
+                         if imagefile.split('.')[-1] == 'jpg'])
 
 
 # ## Test on Videos
@@ -446,36 +255,22 @@ for imagefile in os.listdir(IMAGE_DIR):
 
 
 # Import everything needed to edit/save/watch video clips
-from moviepy.editor import VideoFileClip
-from IPython.display import HTML
+if __name__ == '__main__':
+    from moviepy.editor import VideoFileClip
+    from IPython.display import HTML
 
 
 # In[ ]:
 
 
-def process_image(image):
+def process_image(image, tracker=None):
     # NOTE: The output you return should be a color image (3 channel) for processing video below
     # TODO: put your pipeline here,
     # you should return the final output (image where lines are drawn on lanes)
-    result = lane_finding_pipeline(image)
+    result = lane_finding_pipeline(image, tracker)
     return result
 
 
-# Let's try the one with the solid white lane on the right first ...
-
-# In[ ]:
-
-
-white_output = 'test_videos_output/solidWhiteRight.mp4'
-## To speed up the testing process you may want to try your pipeline on a shorter subclip of the video
-## To do so add .subclip(start_second,end_second) to the end of the line below
-## Where start_second and end_second are integer values representing the start and end of the subclip
-## You may also uncomment the following line for a subclip of the first 5 seconds
-##clip1 = VideoFileClip("test_videos/solidWhiteRight.mp4").subclip(0,5)
-clip1 = VideoFileClip("test_videos/solidWhiteRight.mp4")
-white_clip = clip1.fl_image(process_image)  # NOTE: this function expects color images!!
-clear_moving_averages()
-
 class timeit():
     from datetime import datetime
 
@@ -486,17 +281,34 @@ class timeit():
         print('runtime: {}'.format(self.datetime.now() - self.tic))
 
 
-# get_ipython().magic(u'time white_clip.write_videofile(white_output, audio=False)')
+# Let's try the one with the solid white lane on the right first ...
+
+# In[ ]:
+
+
+if __name__ == '__main__':
+    white_output = 'test_videos_output/solidWhiteRight.mp4'
+    ## To speed up the testing process you may want to try your pipeline on a shorter subclip of the video
+    ## To do so add .subclip(start_second,end_second) to the end of the line below
+    ## Where start_second and end_second are integer values representing the start and end of the subclip
+    ## You may also uncomment the following line for a subclip of the first 5 seconds
+    ##clip1 = VideoFileClip("test_videos/solidWhiteRight.mp4").subclip(0,5)
+    clip1 = VideoFileClip("test_videos/solidWhiteRight.mp4")
+    white_tracker = LaneTracker()
+    white_clip = clip1.fl_image(lambda image: process_image(image, white_tracker))  # NOTE: this function expects color images!!
+
+    # get_ipython().magic(u'time white_clip.write_videofile(white_output, audio=False)')
 
-with timeit():
-    white_clip.write_videofile(white_output, audio=False)
+    with timeit():
+        white_clip.write_videofile(white_output, audio=False)
 
 # Play the video inline, or if you prefer find the video in your filesystem (should be in the same directory) and play it in your video player of choice.
 
 # In[ ]:
 
 
-HTML("""
+if __name__ == '__main__':
+    HTML("""
 <video width="960" height="540" controls>
   <source src="{0}">
 </video>
@@ -513,24 +325,26 @@ HTML("""
 # In[ ]:
 
 
-yellow_output = 'test_videos_output/solidYellowLeft.mp4'
-## To speed up the testing process you may want to try your pipeline on a shorter subclip of the video
-## To do so add .subclip(start_second,end_second) to the end of the line below
-## Where start_second and end_second are integer values representing the start and end of the subclip
-## You may also uncomment the following line for a subclip of the first 5 seconds
-##clip2 = VideoFileClip('test_videos/solidYellowLeft.mp4').subclip(0,5)
-clip2 = VideoFileClip('test_videos/solidYellowLeft.mp4')
-yellow_clip = clip2.fl_image(process_image)
-clear_moving_averages()
+if __name__ == '__main__':
+    yellow_output = 'test_videos_output/solidYellowLeft.mp4'
+    ## To speed up the testing process you may want to try your pipeline on a shorter subclip of the video
+    ## To do so add .subclip(start_second,end_second) to the end of the line below
+    ## Where start_second and end_second are integer values representing the start and end of the subclip
+    ## You may also uncomment the following line for a subclip of the first 5 seconds
+    ##clip2 = VideoFileClip('test_videos/solidYellowLeft.mp4').subclip(0,5)
+    clip2 = VideoFileClip('test_videos/solidYellowLeft.mp4')
+    yellow_tracker = LaneTracker()
+    yellow_clip = clip2.fl_image(lambda image: process_image(image, yellow_tracker))
 
-# get_ipython().magic(u'time yellow_clip.write_videofile(yellow_output, audio=False)')
-with timeit():
-    yellow_clip.write_videofile(yellow_output, audio=False)
+    # get_ipython().magic(u'time yellow_clip.write_videofile(yellow_output, audio=False)')
+    with timeit():
+        yellow_clip.write_videofile(yellow_output, audio=False)
 
 # In[ ]:
 
 
-HTML("""
+if __name__ == '__main__':
+    HTML("""
 <video width="960" height="540" controls>
   <source src="{0}">
 </video>
@@ -548,24 +362,26 @@ HTML("""
 # In[ ]:
 
 
-challenge_output = 'test_videos_output/challenge.mp4'
-## To speed up the testing process you may want to try your pipeline on a shorter subclip of the video
-## To do so add .subclip(start_second,end_second) to the end of the line below
-## Where start_second and end_second are integer values representing the start and end of the subclip
-## You may also uncomment the following line for a subclip of the first 5 seconds
-##clip3 = VideoFileClip('test_videos/challenge.mp4').subclip(0,5)
-clip3 = VideoFileClip('test_videos/challenge.mp4')
-challenge_clip = clip3.fl_image(process_image)
-clear_moving_averages()
+if __name__ == '__main__':
+    challenge_output = 'test_videos_output/challenge.mp4'
+    ## To speed up the testing process you may want to try your pipeline on a shorter subclip of the video
+    ## To do so add .subclip(start_second,end_second) to the end of the line below
+    ## Where start_second and end_second are integer values representing the start and end of the subclip
+    ## You may also uncomment the following line for a subclip of the first 5 seconds
+    ##clip3 = VideoFileClip('test_videos/challenge.mp4').subclip(0,5)
+    clip3 = VideoFileClip('test_videos/challenge.mp4')
+    challenge_tracker = LaneTracker()
+    challenge_clip = clip3.fl_image(lambda image: process_image(image, challenge_tracker))
 
-# get_ipython().magic(u'time challenge_clip.write_videofile(challenge_output, audio=False)')
-with timeit():
-    challenge_clip.write_videofile(challenge_output, audio=False)
+    # get_ipython().magic(u'time challenge_clip.write_videofile(challenge_output, audio=False)')
+    with timeit():
+        challenge_clip.write_videofile(challenge_output, audio=False)
 
 # In[ ]:
 
 
-HTML("""
+if __name__ == '__main__':
+    HTML("""
 <video width="960" height="540" controls>
   <source src="{0}">
 </video>
@@ -0,0 +1,466 @@
+# coding: utf-8
+
+# Reproducible benchmarks of the lane finding pipeline.
+#
+# Usage:
+#   python benchmark.py                                  # run and write benchmark_results.json
+#   python benchmark.py --save baseline.json             # record a baseline
+#   python benchmark.py --compare baseline.json          # fail on regressions beyond --threshold
+#   python benchmark.py --downscale-report               # lane line error and speed per downscale factor
+#   python benchmark.py --tracker-report                 # lag and jitter of the lane line smoothing
+#   python benchmark.py --fit-report                     # error and time of the lane line fits
+#   python benchmark.py --import-report                  # import time of lane_core against its budget
+#
+# Each workload runs over the test images and the test videos at several
+# resolutions. Every case runs in a fresh worker process, so that its peak RSS
+# is not inflated by the cases before it. Frames are decoded while running, but
+# only the workload itself is timed.
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+WORKLOADS = ('lane_finding_pipeline', 'LaneFindingPipeline', 'detect', 'hough_lines')
+SCALES = (0.5, 1.0, 2.0)
+IMAGE_DIR = 'test_images'
+VIDEO_DIR = 'test_videos'
+# seconds a fresh interpreter may take to import the lane finding core, numpy and OpenCV included
+IMPORT_BUDGET = 0.25
+# metric: True if higher is better
+METRICS = {'fps': True, 'p50_ms': False, 'p95_ms': False, 'p99_ms': False, 'peak_rss_mb': False}
+
+
+def iter_frames(source, scale, repeat=1, max_frames=None, frame_cache=None):
+    """
+    Yields the RGB frames of `source`, which is IMAGE_DIR (all jpg images,
+    `repeat` times) or a video file, resized by `scale`. The frames of a video
+    are read from the FrameCache in directory `frame_cache` if given, and are
+    then read-only.
+    """
+    import cv2
+
+    def resize(frame):
+        if scale == 1.0:
+            return frame
+        return cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    count = 0
+    if source == IMAGE_DIR:
+        paths = sorted(glob.glob(os.path.join(IMAGE_DIR, '*.jpg')))
+        for _ in range(repeat):
+            for path in paths:
+                if max_frames is not None and count >= max_frames:
+                    return
+                yield resize(cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2RGB))
+                count += 1
+    elif frame_cache is not None:
+        from frame_cache import FrameCache
+
+        for frame in FrameCache(frame_cache).frames(source)[:max_frames]:
+            yield resize(frame)
+    else:
+        capture = cv2.VideoCapture(source)
+        while max_frames is None or count < max_frames:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield resize(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            count += 1
+        capture.release()
+
+
+def run_case(workload, source, scale, repeat, max_frames, frame_cache=None):
+    """
+    Runs `workload` over the frames of `source` at `scale` and returns its
+    frame rate, per-frame latency percentiles and the peak RSS of the process.
+    """
+    from lane_core import (LaneFindingPipeline, LaneTracker, default_parameters as params, hough_lines,
+                           lane_edges, lane_finding_pipeline)
+
+    latencies = []
+    tracker = LaneTracker()
+    buffered = LaneFindingPipeline(tracker)
+    for frame in iter_frames(source, scale, repeat, max_frames, frame_cache):
+        if workload == 'lane_finding_pipeline':
+            tic = time.perf_counter()
+            lane_finding_pipeline(frame, tracker)
+        elif workload == 'LaneFindingPipeline':
+            tic = time.perf_counter()
+            buffered(frame)
+        elif workload == 'detect':
+            tic = time.perf_counter()
+            buffered.detect(frame)
+            buffered.record()
+        elif workload == 'hough_lines':
+            edges = lane_edges(frame)
+            tic = time.perf_counter()
+            hough_lines(edges, params.rho, params.theta, params.threshold, params.min_line_length,
+                        params.max_line_gap, tracker)
+        else:
+            raise ValueError('Unknown workload: {}'.format(workload))
+        latencies.append(time.perf_counter() - tic)
+    latencies = np.array(latencies) * 1e3
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kB on Linux but in bytes on macOS
+    peak_rss_mb = peak_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    p50, p95, p99 = np.percentile(latencies, (50, 95, 99))
+    return {'frames': len(latencies), 'fps': 1e3 * len(latencies) / latencies.sum(),
+            'mean_ms': float(latencies.mean()), 'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99),
+            'peak_rss_mb': float(peak_rss_mb)}
+
+
+def run_suite(workloads=WORKLOADS, scales=SCALES, repeat=5, max_frames=None, frame_cache=None):
+    """
+    Runs every workload over the test images and every test video at every
+    scale, each case in its own process. Returns {case name: result}.
+    """
+    sources = [IMAGE_DIR] + sorted(glob.glob(os.path.join(VIDEO_DIR, '*.mp4')))
+    results = {}
+    for workload in workloads:
+        for source in sources:
+            for scale in scales:
+                name = '{}/{}@{:g}'.format(workload, os.path.basename(source.rstrip('/')), scale)
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                    results[name] = executor.submit(run_case, workload, source, scale, repeat, max_frames,
+                                                    frame_cache).result()
+                print_result(name, results[name])
+    return results
+
+
+def downscale_report(downscales=(1, 2, 4), repeat=5, max_frames=None, frame_cache=None):
+    """
+    Compares LaneFindingPipeline at each of `downscales` against full
+    resolution on the test images and videos: time per frame, the error of
+    the lane line endpoints in full resolution pixels, and the number of
+    frames in which a lane line was found at only one of the resolutions.
+
+    Every test image is processed on its own, every video as one stream.
+    Returns {source: {downscale: result}}.
+    """
+    from lane_core import LaneFindingPipeline, lane_line_sides
+
+    sources = [IMAGE_DIR] + sorted(glob.glob(os.path.join(VIDEO_DIR, '*.mp4')))
+    report = {}
+    for source in sources:
+        frames = list(iter_frames(source, 1.0, 1, max_frames, frame_cache))
+        # (lane line sides per frame, seconds per frame)
+        runs = {}
+        for downscale in downscales:
+            pipeline = LaneFindingPipeline(downscale=downscale)
+            out = np.empty_like(frames[0])
+            sides = []
+            for frame in frames:
+                if source == IMAGE_DIR:
+                    pipeline.reset()
+                pipeline(frame, out=out)
+                sides.append(lane_line_sides(pipeline.lines))
+            tic = time.perf_counter()
+            for _ in range(repeat):
+                for frame in frames:
+                    if source == IMAGE_DIR:
+                        pipeline.reset()
+                    pipeline(frame, out=out)
+            runs[downscale] = (sides, (time.perf_counter() - tic) / (repeat * len(frames)))
+        reference, reference_time = runs[1] if 1 in runs else runs[min(runs)]
+        report[source] = {}
+        for downscale, (sides, runtime) in runs.items():
+            errors = []
+            mismatches = 0
+            for frame_sides, reference_sides in zip(sides, reference):
+                if frame_sides.keys() != reference_sides.keys():
+                    mismatches += 1
+                for side in frame_sides.keys() & reference_sides.keys():
+                    # the lines share their y coordinates, so compare the x at the bottom and the top
+                    errors += [abs(frame_sides[side][0] - reference_sides[side][0]),
+                               abs(frame_sides[side][2] - reference_sides[side][2])]
+            errors = np.array(errors or [0.])
+            result = {'frames': len(frames), 'ms_per_frame': runtime * 1e3, 'speedup': reference_time / runtime,
+                      'mean_error_px': float(errors.mean()), 'p95_error_px': float(np.percentile(errors, 95)),
+                      'max_error_px': float(errors.max()), 'mismatched_frames': mismatches}
+            report[source][downscale] = result
+            print('{:<40} 1/{:<2d} {:7.2f} ms/frame  x{:4.2f}  endpoint error mean {:5.2f} px  p95 {:5.1f} px  '
+                  'max {:5.1f} px  {} of {} frames with other lines found'.format(
+                      source, downscale, result['ms_per_frame'], result['speedup'], result['mean_error_px'],
+                      result['p95_error_px'], result['max_error_px'], mismatches, len(frames)))
+    return report
+
+
+class _FitRecorder():
+    # a tracker that passes the fits of every frame through and records them
+    def __init__(self):
+        self.frame = {}
+
+    def clear(self):
+        pass
+
+    def update(self, new_slope, new_x_mid, index):
+        self.frame[index] = (new_slope, new_x_mid)
+        return new_slope, new_x_mid
+
+    def predict(self, index):
+        return None
+
+
+def tracker_report(window=15, max_frames=None, frame_cache=None):
+    """
+    Compares the lane line smoothing of LaneTracker with histories of
+    `window` and of 5 frames and of KalmanLaneTracker on the test videos.
+
+    The lane lines fitted in every frame are recorded once and replayed into
+    each tracker. Lag is the mean distance of the smoothed lane line x
+    coordinates (at the bottom and the top of the lane line) from a centered,
+    non-causal `window` frame average of the fitted ones, which a tracker can
+    only match by following the lane without delay. Jitter is the RMS change of
+    their velocity from frame to frame. Both are in pixels.
+    Returns {video: {tracker name: result}}.
+    """
+    from lane_core import KalmanLaneTracker, LaneFindingPipeline, LaneTracker
+
+    trackers = {'average{}'.format(window): lambda: LaneTracker(window), 'average5': lambda: LaneTracker(5),
+                'kalman': KalmanLaneTracker}
+    report = {}
+    for source in sorted(glob.glob(os.path.join(VIDEO_DIR, '*.mp4'))):
+        recorder = _FitRecorder()
+        pipeline = LaneFindingPipeline(recorder)
+        fits = []
+        for frame in iter_frames(source, 1.0, 1, max_frames, frame_cache):
+            recorder.frame = {}
+            pipeline(frame)
+            fits.append(recorder.frame)
+        height = frame.shape[0]
+        # x of a lane line at the bottom and the top, from its slope and its x at y_mid
+        ys = np.array([height - 1, int(height * 5 / 8)]) - height * 3 / 4
+        report[source] = {}
+        for name, make_tracker in trackers.items():
+            tracker = make_tracker()
+            lags, jitters = [], []
+            predicted = 0
+            tic = time.perf_counter()
+            smoothed = [{side: tracker.update(*fit[side], side) if side in fit else tracker.predict(side)
+                         for side in ('pos', 'neg')} for fit in fits]
+            runtime = time.perf_counter() - tic
+            for side in ('pos', 'neg'):
+                measured = np.array([(fit[side][1] + ys / fit[side][0]) if side in fit else (np.nan, np.nan)
+                                     for fit in fits])
+                output = np.array([(frame[side][1] + ys / frame[side][0]) if frame[side] is not None
+                                   else (np.nan, np.nan) for frame in smoothed])
+                predicted += sum(side not in fit and frame[side] is not None for fit, frame in zip(fits, smoothed))
+                half = window // 2
+                reference = np.array([np.nanmean(measured[max(0, k - half):k + half + 1], axis=0)
+                                      for k in range(len(fits))])
+                lags.append(np.abs(output - reference)[~np.isnan(output - reference)])
+                acceleration = np.diff(output, 2, axis=0)
+                jitters.append(acceleration[~np.isnan(acceleration)])
+            lags, jitters = np.concatenate(lags), np.concatenate(jitters)
+            result = {'frames': len(fits), 'lag_px': float(lags.mean()),
+                      'jitter_px': float(np.sqrt(np.mean(np.square(jitters)))),
+                      'predicted_lines': int(predicted), 'us_per_frame': runtime / len(fits) * 1e6}
+            report[source][name] = result
+            print('{:<40} {:<10} lag {:5.2f} px  jitter {:5.2f} px  {:3d} predicted lines  {:6.1f} us/frame'.format(
+                source, name, result['lag_px'], result['jitter_px'], result['predicted_lines'],
+                result['us_per_frame']))
+    return report
+
+
+def _synthetic_segments(random, imshape, outliers):
+    # Hough-like segments along two known lane lines, with `outliers` segments per side in the same slope band
+    # off the lane line, like shadow edges or a neighbouring lane; returns (lines, truth)
+    y_mid = imshape[0] * 3 / 4
+    truth = {'pos': (random.uniform(0.55, 0.75), random.uniform(0.65, 0.8) * imshape[1]),
+             'neg': (random.uniform(-0.75, -0.55), random.uniform(0.2, 0.35) * imshape[1])}
+    segments = []
+    for slope, x_mid in truth.values():
+        for k in range(random.integers(3, 7) + outliers):
+            offset = 0. if k >= outliers else random.choice([-1, 1]) * random.uniform(30, 120)
+            outlier_slope = slope if k >= outliers else slope * random.uniform(0.85, 1.15)
+            y1 = random.uniform(imshape[0] * 5 / 8, imshape[0] - 40)
+            y2 = min(imshape[0] - 1, y1 + random.uniform(20, 80))
+            x1, x2 = (x_mid + offset + (y - y_mid) / outlier_slope + random.normal(0, 1) for y in (y1, y2))
+            segments.append([x1, y1, x2, y2])
+    return np.round(segments).astype(np.int32).reshape(-1, 1, 4), truth
+
+
+def fit_report(fits=('average', 'lsq', 'ransac'), window=15, outliers=3, max_frames=None, frame_cache=None, seed=0):
+    """
+    Compares the lane line fits of LaneParameters.fit values `fits`.
+
+    On the test videos, the Hough segments of every frame are recorded once
+    and fitted with each method, without smoothing: noise is the mean distance
+    of the fitted lane line x coordinates (at the bottom and the top of the
+    lane line) from a centered `window` frame median of them. On 1000 synthetic
+    frames of segments along known lane lines, with `outliers` segments per
+    side off them, error is the mean distance from the true lane lines. Both
+    are in pixels. Returns {source: {fit: result}}.
+    """
+    from lane_core import LaneFindingPipeline, default_parameters, fit_lanes
+
+    random = np.random.default_rng(seed)
+    sources = {}
+    for source in sorted(glob.glob(os.path.join(VIDEO_DIR, '*.mp4'))):
+        pipeline = LaneFindingPipeline()
+        segment_sets = []
+        for frame in iter_frames(source, 1.0, 1, max_frames, frame_cache):
+            pipeline.detect(frame)
+            segment_sets.append((None if pipeline.segments is None else pipeline.segments.copy(), None))
+        sources[source] = (segment_sets, frame.shape)
+    imshape = (540, 960)
+    sources['synthetic, {} outliers'.format(outliers)] = (
+        [_synthetic_segments(random, imshape, outliers) for _ in range(1000)], imshape)
+    report = {}
+    for source, (segment_sets, imshape) in sources.items():
+        y_mid = imshape[0] * 3 / 4
+        # x of a lane line at the bottom and the top, from its slope and its x at y_mid
+        ys = np.array([imshape[0] - 1, int(imshape[0] * 5 / 8)]) - y_mid
+        report[source] = {}
+        for fit in fits:
+            params = default_parameters._replace(fit=fit)
+            tic = time.perf_counter()
+            frame_fits = [fit_lanes(lines, y_mid, params) for lines, _ in segment_sets]
+            runtime = time.perf_counter() - tic
+            errors, found = [], 0
+            for side, side_fits in zip(('pos', 'neg'), zip(*frame_fits)):
+                xs = np.array([(fit[1] + ys / fit[0]) if fit is not None else (np.nan, np.nan) for fit in side_fits])
+                found += int(np.sum(~np.isnan(xs[:, 0])))
+                if segment_sets[0][1] is not None:
+                    reference = np.array([truth[side][1] + ys / truth[side][0] for _, truth in segment_sets])
+                else:
+                    half = window // 2
+                    reference = np.array([np.nanmedian(xs[max(0, k - half):k + half + 1], axis=0)
+                                          for k in range(len(xs))])
+                errors.append(np.abs(xs - reference)[~np.isnan(xs - reference)])
+            errors = np.concatenate(errors)
+            result = {'frames': len(segment_sets), 'error_px': float(errors.mean()),
+                      'p95_error_px': float(np.percentile(errors, 95)), 'found': found / (2 * len(segment_sets)),
+                      'us_per_frame': runtime / len(segment_sets) * 1e6}
+            report[source][fit] = result
+            print('{:<40} {:<8} {} {:6.2f} px  p95 {:6.2f} px  {:5.1%} found  {:6.1f} us/frame'.format(
+                source, fit, 'error' if segment_sets[0][1] is not None else 'noise', result['error_px'],
+                result['p95_error_px'], result['found'], result['us_per_frame']))
+    return report
+
+
+def import_report(modules=('lane_core', 'P1'), repeat=5, budget=IMPORT_BUDGET):
+    """
+    Times importing each of `modules` in `repeat` fresh interpreters, as a
+    worker process does when it starts, and reports the heavy dependencies
+    it loads. Returns ({module: median seconds}, whether lane_core was
+    imported within `budget` seconds).
+    """
+    import subprocess
+
+    heavy = ('matplotlib', 'moviepy', 'IPython')
+    code = ('import sys, time; tic = time.perf_counter(); import {}; '
+            'print(time.perf_counter() - tic, *(name for name in {!r} if name in sys.modules))')
+    report = {}
+    for module in modules:
+        runs = [subprocess.run([sys.executable, '-c', code.format(module, heavy)], check=True, capture_output=True,
+                               text=True).stdout.split() for _ in range(repeat)]
+        report[module] = float(np.median([float(run[0]) for run in runs]))
+        print('{:<12} {:7.1f} ms to import{}'.format(
+            module, report[module] * 1e3, ', loads ' + ', '.join(runs[0][1:]) if runs[0][1:] else ''))
+    within_budget = report.get('lane_core', 0.) <= budget
+    print('lane_core import {} the budget of {:.0f} ms'.format('within' if within_budget else 'OVER', budget * 1e3))
+    return report, within_budget
+
+
+def print_result(name, result):
+    print('{:<50} {:6d} frames {:8.1f} fps  p50 {:7.2f} ms  p95 {:7.2f} ms  p99 {:7.2f} ms  rss {:6.1f} MB'.format(
+        name, result['frames'], result['fps'], result['p50_ms'], result['p95_ms'], result['p99_ms'],
+        result['peak_rss_mb']))
+
+
+def environment():
+    import cv2
+
+    return {'date': datetime.datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+            'numpy': np.__version__, 'opencv': cv2.__version__, 'machine': platform.machine(),
+            'processor': platform.processor(), 'cpus': os.cpu_count()}
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns a list of messages for the metrics of `results` that are worse than
+    in `baseline` by more than the fraction `threshold`.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = baseline[name][metric], result[metric]
+            if old <= 0:
+                continue
+            change = (old - new) / old if higher_is_better else (new - old) / old
+            if change > threshold:
+                regressions.append('{} {}: {:.2f} -> {:.2f} ({:+.0%})'.format(name, metric, old, new, (new - old) / old))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the lane finding pipeline on the test images and videos.')
+    parser.add_argument('--save', metavar='PATH', default='benchmark_results.json',
+                        help='write the results to PATH (default: %(default)s)')
+    parser.add_argument('--compare', metavar='BASELINE', default=None,
+                        help='compare with a saved baseline and exit with status 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='fraction by which a metric may be worse than the baseline (default: %(default)s)')
+    parser.add_argument('--workloads', nargs='+', choices=WORKLOADS, default=WORKLOADS)
+    parser.add_argument('--scales', nargs='+', type=float, default=SCALES, help='frame resolution scales')
+    parser.add_argument('--repeat', type=int, default=5, help='passes over the test images (default: %(default)s)')
+    parser.add_argument('--max-frames', type=int, default=None, help='frames per source at most')
+    parser.add_argument('--downscale-report', nargs='*', type=int, metavar='DOWNSCALE', default=None,
+                        help='instead of the suite, report lane line error and speed of LaneFindingPipeline '
+                             'at these downscale factors (default: 1 2 4)')
+    parser.add_argument('--tracker-report', action='store_true',
+                        help='instead of the suite, report lag and jitter of the moving averages and the Kalman filter')
+    parser.add_argument('--import-report', action='store_true',
+                        help='instead of the suite, time importing lane_core and P1 and exit with status 1 if '
+                             'lane_core takes longer than {:.0f} ms'.format(IMPORT_BUDGET * 1e3))
+    parser.add_argument('--fit-report', action='store_true',
+                        help='instead of the suite, report error and time of the lane line fits')
+    parser.add_argument('--frame-cache', metavar='DIR', nargs='?', const='.frame_cache', default=None,
+                        help='decode each video once into a frame cache in DIR (default: %(const)s) and '
+                             'read its frames from there')
+    args = parser.parse_args(argv)
+
+    if args.tracker_report:
+        tracker_report(max_frames=args.max_frames, frame_cache=args.frame_cache)
+        return
+    if args.import_report:
+        if not import_report()[1]:
+            sys.exit(1)
+        return
+    if args.fit_report:
+        fit_report(max_frames=args.max_frames, frame_cache=args.frame_cache)
+        return
+    if args.downscale_report is not None:
+        downscale_report(args.downscale_report or (1, 2, 4), args.repeat, args.max_frames, args.frame_cache)
+        return
+
+    results = run_suite(args.workloads, args.scales, args.repeat, args.max_frames, args.frame_cache)
+    with open(args.save, 'w') as results_file:
+        json.dump({'environment': environment(), 'results': results}, results_file, indent=1)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline['results'], args.threshold)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        if regressions:
+            sys.exit(1)
+        print('No regressions beyond {:.0%} against {}'.format(args.threshold, args.compare))
+
+
+if __name__ == '__main__':
+    main()
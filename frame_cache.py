@@ -0,0 +1,169 @@
+# coding: utf-8
+
+# On-disk cache of decoded video frames for repeated tuning runs.
+#
+# Usage:
+#   cache = FrameCache()
+#   frames = cache.frames('test_videos/solidWhiteRight.mp4')          # (n, h, w, 3) RGB
+#   gray = cache.frames('test_videos/solidWhiteRight.mp4', 'gray')    # (n, h, w)
+#   blurred = cache.frames('test_videos/solidWhiteRight.mp4', 'blur', kernel_size=5)
+#
+# A video is decoded once per kind of frames; later runs, in this or any other
+# process, memory-map the decoded frames instead, so reading a frame copies
+# nothing. Entries are keyed by a hash of the video file's content, so a video
+# that is renamed is still found and one that is replaced is decoded again.
+# The least recently used entries are evicted beyond a size limit.
+#
+# Each entry is a raw file of frames and a JSON file describing them, which is
+# written last and whose modification time records the last use.
+
+import hashlib
+import json
+import os
+import tempfile
+
+import cv2
+import numpy as np
+
+CACHE_DIR = '.frame_cache'
+KINDS = ('rgb', 'gray', 'blur')
+
+_hashes = {}
+
+
+def video_hash(path, chunk_size=1 << 20):
+    """
+    Returns a hex digest of the content of file `path`, remembered per path,
+    size and modification time for the life of the process.
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _hashes:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as video_file:
+            for chunk in iter(lambda: video_file.read(chunk_size), b''):
+                digest.update(chunk)
+        _hashes[key] = digest.hexdigest()
+    return _hashes[key]
+
+
+class FrameCache():
+    """
+    Decoded frames of videos in directory `path`, using at most `max_bytes` of
+    disk space (apart from the entry in use, which is never evicted).
+    """
+
+    def __init__(self, path=CACHE_DIR, max_bytes=4 << 30):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def frames(self, video_path, kind='rgb', kernel_size=5):
+        """
+        Returns the frames of `video_path` as a read-only memory-mapped array:
+        RGB frames of shape (n, h, w, 3) for `kind` 'rgb', grayscale frames of
+        shape (n, h, w) for 'gray', or grayscale frames blurred like
+        gaussian_blur(gray, kernel_size) for 'blur'. The video is decoded into
+        the cache first if needed.
+        """
+        if kind not in KINDS:
+            raise ValueError('Unknown kind of frames: {}'.format(kind))
+        name = '{}_{}'.format(video_hash(video_path), kind if kind != 'blur' else 'blur{}'.format(kernel_size))
+        meta_path = os.path.join(self.path, name + '.json')
+        if not os.path.exists(meta_path):
+            self._decode(video_path, kind, kernel_size, name)
+            self.evict(keep=name)
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+        # the modification time of the description is the time of last use
+        os.utime(meta_path)
+        shape = tuple(meta['shape'])
+        if shape[0] == 0:
+            return np.empty(shape, dtype=np.uint8)
+        return np.memmap(os.path.join(self.path, name + '.frames'), dtype=np.uint8, mode='r', shape=shape)
+
+    def _decode(self, video_path, kind, kernel_size, name):
+        capture = cv2.VideoCapture(video_path)
+        if not capture.isOpened():
+            raise IOError('Cannot open video: {}'.format(video_path))
+        n_frames = 0
+        frame = None
+        shape = None
+        # written under a temporary name, so that other processes never see part of an entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as frames_file:
+                while True:
+                    ok, frame = capture.read(frame)
+                    if not ok:
+                        break
+                    if kind == 'rgb':
+                        decoded = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                    else:
+                        decoded = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                        if kind == 'blur':
+                            decoded = cv2.GaussianBlur(decoded, (kernel_size, kernel_size), 0)
+                    frames_file.write(decoded.data)
+                    shape = decoded.shape
+                    n_frames += 1
+            os.replace(tmp_path, os.path.join(self.path, name + '.frames'))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        finally:
+            capture.release()
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as meta_file:
+                json.dump({'video': video_path, 'kind': kind, 'kernel_size': kernel_size,
+                           'shape': [n_frames] + list(shape or (0, 0))}, meta_file)
+            os.replace(tmp_path, os.path.join(self.path, name + '.json'))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def entries(self):
+        """
+        Returns [(last use time, size in bytes, name)] of the entries, least
+        recently used first.
+        """
+        entries = []
+        for filename in os.listdir(self.path):
+            name, ext = os.path.splitext(filename)
+            if ext != '.json':
+                continue
+            try:
+                last_use = os.path.getmtime(os.path.join(self.path, filename))
+                size = os.path.getsize(os.path.join(self.path, name + '.frames'))
+            except FileNotFoundError:
+                # evicted by another process meanwhile
+                continue
+            entries.append((last_use, size, name))
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used entries, other than `keep`, until the
+        cache fits in `max_bytes`.
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            self._remove(name)
+            total -= size
+
+    def clear(self):
+        for _, _, name in self.entries():
+            self._remove(name)
+
+    def _remove(self, name):
+        # the description first, so the entry is never found without its frames
+        for ext in ('.json', '.frames'):
+            try:
+                os.remove(os.path.join(self.path, name + ext))
+            except FileNotFoundError:
+                pass
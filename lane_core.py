@@ -0,0 +1,1180 @@
+# coding: utf-8
+
+# The lane finding core of P1: parameters, helper functions, lane line fitting
+# and smoothing, and the lane finding pipelines.
+#
+# Usage:
+#   from lane_core import LaneFindingPipeline
+#   pipeline = LaneFindingPipeline()
+#   for frame in frames:                  # RGB frames of one video
+#       output = pipeline(frame)
+#
+# It only needs numpy and OpenCV and does no work when imported, so that worker
+# processes and other tools start quickly; P1.py, the script with the demos,
+# re-exports its public names (__all__).
+
+import csv
+import json
+import math
+import time
+from collections import namedtuple
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+
+__all__ = [
+    'LaneParameters', 'default_parameters',
+    'grayscale', 'canny', 'gaussian_blur', 'WHITE_HLS', 'YELLOW_HLS', 'color_select',
+    'roi_mask', 'region_of_interest', 'draw_lines',
+    'prev_size', 'LaneTracker', 'KalmanLaneTracker', 'default_tracker', 'moving_averages', 'clear_moving_averages',
+    'classify_lane_segments', 'fit_lane_segments', 'fit_lane_segments_loop', 'weighted_line_fit', 'ransac_line_fit',
+    'fit_lanes', 'lane_fits', 'track_lane_fits', 'lane_lines_from_fits', 'lane_lines_from_segments', 'lane_line_sides',
+    'LANE_RECORD_DTYPE', 'lane_record', 'lane_lines', 'hough_lines', 'weighted_img',
+    'lane_roi_vertices', 'lane_roi_top', 'lane_edge_band', 'lane_edges', 'hough_segments', 'lane_finding_pipeline',
+    'StageProfiler', 'LaneFindingPipeline', 'RealTimePipeline',
+]
+
+
+# The tuning parameters of the pipeline: the Gaussian blur kernel size, the Canny
+# thresholds, the Hough transform parameters, the slope bands of the lane sides
+# and how the segments of a side are fitted (see fit_lanes()).
+LaneParameters = namedtuple('LaneParameters', [
+    'kernel_size', 'low_threshold', 'high_threshold',
+    'rho', 'theta', 'threshold', 'min_line_length', 'max_line_gap',
+    'min_pos_slope', 'max_pos_slope', 'min_neg_slope', 'max_neg_slope',
+    'fit', 'ransac_iterations', 'ransac_threshold'],
+    defaults=[5, 60, 120,
+              2, np.pi / 180, 50, 25, 100,
+              0.5, 0.8, -0.8, -0.5,
+              'average', 8, 25.])
+default_parameters = LaneParameters()
+
+
+def grayscale(img):
+    """Applies the Grayscale transform
+    This will return an image with only one color channel
+    but NOTE: to see the returned image as grayscale
+    (assuming your grayscaled image is called 'gray')
+    you should call plt.imshow(gray, cmap='gray')"""
+    return cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+    # Or use BGR2GRAY if you read an image with cv2.imread()
+    # return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+
+def canny(img, low_threshold, high_threshold):
+    """Applies the Canny transform"""
+    return cv2.Canny(img, low_threshold, high_threshold)
+
+
+def gaussian_blur(img, kernel_size):
+    """Applies a Gaussian Noise kernel"""
+    return cv2.GaussianBlur(img, (kernel_size, kernel_size), 0)
+
+
+# HLS ranges (OpenCV: H 0-180, L and S 0-255) of white and yellow lane markings
+WHITE_HLS = (np.array([0, 180, 0], dtype=np.uint8), np.array([180, 255, 255], dtype=np.uint8))
+YELLOW_HLS = (np.array([10, 80, 100], dtype=np.uint8), np.array([40, 255, 255], dtype=np.uint8))
+
+
+def color_select(img):
+    """
+    Returns a mask of the pixels of RGB image `img` that have the color of a
+    white or a yellow lane marking.
+    """
+    hls = cv2.cvtColor(img, cv2.COLOR_RGB2HLS)
+    return cv2.inRange(hls, *WHITE_HLS) | cv2.inRange(hls, *YELLOW_HLS)
+
+
+@lru_cache(maxsize=16)
+def _roi_mask(shape, dtype, vertices, ignore_mask_color):
+    mask = np.zeros(shape, dtype=dtype)
+    cv2.fillPoly(mask, np.array(vertices, dtype=np.int32), ignore_mask_color)
+    mask.setflags(write=False)
+    return mask
+
+
+def roi_mask(shape, vertices, ignore_mask_color=255, dtype=np.uint8):
+    """
+    Returns a mask of `shape` filled with `ignore_mask_color` inside the polygon
+    formed from `vertices` and 0 outside.
+
+    The frame size of a video never changes, so masks are cached per shape,
+    vertices, color and dtype (the 16 most recently used are kept). The returned
+    mask is shared and therefore read-only.
+    """
+    vertices = tuple(tuple(map(tuple, polygon)) for polygon in np.asarray(vertices).tolist())
+    return _roi_mask(tuple(shape), np.dtype(dtype).str, vertices, ignore_mask_color)
+
+
+def region_of_interest(img, vertices):
+    """
+    Applies an image mask.
+
+    Only keeps the region of the image defined by the polygon
+    formed from `vertices`. The rest of the image is set to black.
+    """
+    # defining a 3 channel or 1 channel color to fill the mask with depending on the input image
+    if len(img.shape) > 2:
+        channel_count = img.shape[2]  # i.e. 3 or 4 depending on your image
+        ignore_mask_color = (255,) * channel_count
+    else:
+        ignore_mask_color = 255
+
+    # mask with pixels inside the polygon defined by "vertices" set to the fill color
+    mask = roi_mask(img.shape, vertices, ignore_mask_color, img.dtype)
+
+    # returning the image only where mask pixels are nonzero
+    masked_image = cv2.bitwise_and(img, mask)
+    return masked_image
+
+
+def draw_lines(img, lines, color=[255, 0, 0], thickness=5):
+    """
+    NOTE: this is the function you might want to use as a starting point once you want to
+    average/extrapolate the line segments you detect to map out the full
+    extent of the lane (going from the result shown in raw-lines-example.mp4
+    to that shown in P1_example.mp4).
+
+    Think about things like separating line segments by their
+    slope ((y2-y1)/(x2-x1)) to decide which segments are part of the left
+    line vs. the right line.  Then, you can average the position of each of
+    the lines and extrapolate to the top and bottom of the lane.
+
+    This function draws `lines` with `color` and `thickness`.
+    Lines are drawn on the image inplace (mutates the image).
+    If you want to make the lines semi-transparent, think about combining
+    this function with the weighted_img() function below
+    """
+    for line in lines:
+        for x1, y1, x2, y2 in line:
+            cv2.line(img, (x1, y1), (x2, y2), color, thickness)
+
+
+prev_size = 15 # keep past slopes and x_mids
+
+
+class LaneTracker():
+    """
+    Keeps the moving averages of lane line slopes and x_mids of one video stream.
+
+    The last `size` slopes and x_mids of each side ('pos' or 'neg') are kept in a
+    preallocated ring buffer together with their running sums, so an update is O(1).
+    Use one tracker per video or camera so that streams do not share history.
+    """
+
+    def __init__(self, size=prev_size):
+        self.size = size
+        self.history = {'pos': np.zeros((size, 2)), 'neg': np.zeros((size, 2))}
+        self.clear()
+
+    def clear(self):
+        self.sums = {'pos': [0., 0.], 'neg': [0., 0.]}
+        self.counts = {'pos': 0, 'neg': 0}
+        self.heads = {'pos': 0, 'neg': 0}
+
+    def update(self, new_slope, new_x_mid, index):
+        """
+        Returns the average of the previous `size` values and the new value of
+        slope and x_mid for side `index`, and adds the new values to the history.
+        """
+        sums = self.sums[index]
+        count = self.counts[index]
+        mavg_slope = (sums[0] + new_slope) / (count + 1)
+        mavg_x_mid = (sums[1] + new_x_mid) / (count + 1)
+        if self.size == 0:
+            return mavg_slope, mavg_x_mid
+        history = self.history[index]
+        head = self.heads[index]
+        if count == self.size:
+            # evict the oldest sample, which is the one about to be overwritten
+            sums[0] -= history[head, 0]
+            sums[1] -= history[head, 1]
+        else:
+            self.counts[index] = count + 1
+        history[head] = new_slope, new_x_mid
+        sums[0] += new_slope
+        sums[1] += new_x_mid
+        self.heads[index] = (head + 1) % self.size
+        return mavg_slope, mavg_x_mid
+
+    def predict(self, index):
+        """
+        Called instead of update() when no line segments were found for side
+        `index`. The moving averages make no prediction, so it returns None and
+        no lane line is drawn for that side.
+        """
+        return None
+
+
+class KalmanLaneTracker():
+    """
+    Smooths the slopes and x_mids of the lane lines of one video stream with a
+    constant velocity Kalman filter per side, as an alternative to the moving
+    averages of LaneTracker.
+
+    The state of a side is (slope, x_mid) and their change per frame, so it
+    needs no history and follows a turning lane without the lag of an average.
+    `measurement_std` is the standard deviation of the (slope, x_mid) measured
+    in a single frame, `acceleration_std` that of the change of their velocity
+    from frame to frame. When a frame has no line segments for a side, the lane
+    line is predicted from its velocity for up to `max_missed` frames in a row.
+    """
+
+    def __init__(self, measurement_std=(0.02, 4.), acceleration_std=(0.0002, 0.05), max_missed=5):
+        self.max_missed = max_missed
+        self.F = np.eye(4)
+        self.F[0, 2] = self.F[1, 3] = 1.
+        self.H = np.eye(2, 4)
+        self.R = np.diag(np.square(measurement_std))
+        # white noise acceleration, with a time step of one frame
+        q = np.square(acceleration_std)
+        self.Q = np.block([[np.diag(q / 4), np.diag(q / 2)], [np.diag(q / 2), np.diag(q)]])
+        self.clear()
+
+    def clear(self):
+        self.states = {'pos': None, 'neg': None}
+        self.covariances = {'pos': None, 'neg': None}
+        self.missed = {'pos': 0, 'neg': 0}
+
+    def _time_update(self, index):
+        self.states[index] = self.F @ self.states[index]
+        self.covariances[index] = self.F @ self.covariances[index] @ self.F.T + self.Q
+
+    def update(self, new_slope, new_x_mid, index):
+        """
+        Returns the filtered slope and x_mid for side `index` after measuring
+        `new_slope` and `new_x_mid` in the current frame.
+        """
+        z = np.array([new_slope, new_x_mid])
+        if self.states[index] is None or self.missed[index] > self.max_missed:
+            # (re)start from the measurement, with an unknown velocity
+            self.states[index] = np.array([new_slope, new_x_mid, 0., 0.])
+            self.covariances[index] = np.diag(np.concatenate([np.diag(self.R), 100 * np.diag(self.R)]))
+        else:
+            self._time_update(index)
+            P = self.covariances[index]
+            S = self.H @ P @ self.H.T + self.R
+            K = np.linalg.solve(S, self.H @ P).T
+            self.states[index] = self.states[index] + K @ (z - self.H @ self.states[index])
+            self.covariances[index] = (np.eye(4) - K @ self.H) @ P
+        self.missed[index] = 0
+        return self.states[index][0], self.states[index][1]
+
+    def predict(self, index):
+        """
+        Called instead of update() when no line segments were found for side
+        `index`. Returns the predicted slope and x_mid, or None once the side
+        has been missed more than `max_missed` frames in a row.
+        """
+        if self.states[index] is None or self.missed[index] >= self.max_missed:
+            self.missed[index] += 1
+            return None
+        self._time_update(index)
+        self.missed[index] += 1
+        return self.states[index][0], self.states[index][1]
+
+
+default_tracker = LaneTracker()
+
+
+def moving_averages(new_slope, new_x_mid, index):
+    return default_tracker.update(new_slope, new_x_mid, index)
+
+
+def clear_moving_averages():
+    default_tracker.clear()
+
+
+def classify_lane_segments(lines, y_mid, min_pos_slope=default_parameters.min_pos_slope,
+                           max_pos_slope=default_parameters.max_pos_slope,
+                           min_neg_slope=default_parameters.min_neg_slope,
+                           max_neg_slope=default_parameters.max_neg_slope, min_abs_slope=0.01):
+    """
+    Classifies Hough line segments by slope.
+
+    `lines` is the (N,1,4) segment array returned by cv2.HoughLinesP (or None).
+    Vertical and almost horizontal segments are dropped. Returns the remaining
+    segments as an (M,4) array with their slopes and x coordinates at `y_mid`,
+    and masks of those in the positive and the negative slope band, or None if
+    there are no segments.
+    """
+    if lines is None or len(lines) == 0:
+        return None
+    segments = lines.reshape(-1, 4)
+    x1, y1, x2, y2 = segments.T
+    dx = x2 - x1
+    dy = y2 - y1
+    not_vertical = dx != 0
+    segments, x2, y2, dx, dy = (segments[not_vertical], x2[not_vertical], y2[not_vertical],
+                                dx[not_vertical], dy[not_vertical])
+    slopes = dy / dx
+    # ignore almost horizontal lines, they would blow up x_mid
+    sloped = np.abs(slopes) >= min_abs_slope
+    segments, x2, y2, slopes = segments[sloped], x2[sloped], y2[sloped], slopes[sloped]
+    intercepts = y2 - slopes * x2
+    x_mids = (y_mid - intercepts) / slopes
+    # eliminate lines that are outside slope limits specified
+    pos = (slopes >= min_pos_slope) & (slopes <= max_pos_slope)
+    neg = (slopes <= max_neg_slope) & (slopes >= min_neg_slope)
+    return segments, slopes, x_mids, pos, neg
+
+
+def fit_lane_segments(lines, y_mid, min_pos_slope=default_parameters.min_pos_slope,
+                      max_pos_slope=default_parameters.max_pos_slope,
+                      min_neg_slope=default_parameters.min_neg_slope,
+                      max_neg_slope=default_parameters.max_neg_slope, min_abs_slope=0.01):
+    """
+    Classifies Hough line segments by slope and averages each lane side.
+
+    `lines` is the (N,1,4) segment array returned by cv2.HoughLinesP (or None).
+    All segments are processed at once: segments outside the positive and
+    negative slope bands are masked out, and the slopes and x coordinates at
+    `y_mid` of the remaining segments are averaged per side.
+
+    Returns ((pos_slope, pos_x_mid), (neg_slope, neg_x_mid)), where a side is
+    None if no segment fell in its slope band.
+    """
+    classified = classify_lane_segments(lines, y_mid, min_pos_slope, max_pos_slope,
+                                        min_neg_slope, max_neg_slope, min_abs_slope)
+    if classified is None:
+        return None, None
+    _, slopes, x_mids, pos, neg = classified
+    pos_fit = (slopes[pos].mean(), x_mids[pos].mean()) if pos.any() else None
+    neg_fit = (slopes[neg].mean(), x_mids[neg].mean()) if neg.any() else None
+    return pos_fit, neg_fit
+
+
+def fit_lane_segments_loop(lines, y_mid, min_pos_slope=default_parameters.min_pos_slope,
+                           max_pos_slope=default_parameters.max_pos_slope,
+                           min_neg_slope=default_parameters.min_neg_slope,
+                           max_neg_slope=default_parameters.max_neg_slope, min_abs_slope=0.01):
+    """
+    Per-segment reference implementation of fit_lane_segments().
+
+    Kept only to check and benchmark the vectorized version against.
+    """
+    if lines is None:
+        return None, None
+    pos_slopes = []
+    pos_x_mids = []
+    neg_slopes = []
+    neg_x_mids = []
+    for line in lines:
+        for x1, y1, x2, y2 in line:
+            if x2 != x1:
+                slope = (y2-y1)/(x2-x1)
+                if math.fabs(slope) < min_abs_slope:
+                    continue
+                intercept = y2 - slope * x2
+                x_mid = (y_mid - intercept) / slope
+                if (slope >= min_pos_slope) and (slope <= max_pos_slope):
+                    pos_slopes.append(slope)
+                    pos_x_mids.append(x_mid)
+                elif (slope <= max_neg_slope) and (slope >= min_neg_slope):
+                    neg_slopes.append(slope)
+                    neg_x_mids.append(x_mid)
+    pos_fit = (np.average(pos_slopes), np.average(pos_x_mids)) if pos_slopes else None
+    neg_fit = (np.average(neg_slopes), np.average(neg_x_mids)) if neg_slopes else None
+    return pos_fit, neg_fit
+
+
+def weighted_line_fit(segments, y_mid):
+    """
+    Least-squares fit of x = a * (y - y_mid) + x_mid to both endpoints of each
+    of the (M,4) `segments`, weighted by the length of their segment, so that
+    a long segment counts for more than a short one.
+
+    Returns (slope, x_mid) of the fitted line, or None if it is vertical
+    (a == 0, with the same x at every y), as its slope would be infinite.
+    """
+    xs = segments[:, 0::2].astype(np.float64)
+    ys = segments[:, 1::2] - y_mid
+    weights = np.hypot(xs[:, 1] - xs[:, 0], ys[:, 1] - ys[:, 0])
+    total = 2 * weights.sum()
+    x_mean = weights @ xs.sum(axis=1) / total
+    y_mean = weights @ ys.sum(axis=1) / total
+    dy = ys - y_mean
+    a = (weights @ ((xs - x_mean) * dy).sum(axis=1)) / (weights @ (dy * dy).sum(axis=1))
+    if a == 0:
+        return None
+    return 1 / a, x_mean - a * y_mean
+
+
+def ransac_line_fit(segments, y_mid, iterations=default_parameters.ransac_iterations,
+                    threshold=default_parameters.ransac_threshold):
+    """
+    Fits a line to the (M,4) `segments` like weighted_line_fit(), ignoring
+    outliers: the line through each of the `iterations` longest segments is
+    tried, the segments whose endpoints are both within `threshold` pixels of
+    it (horizontally) are its inliers, and the line with the longest inliers
+    in total is refitted to them.
+
+    The hypotheses are picked by length rather than at random, so that a frame
+    always gives the same lane line, and all of them are scored at once, in
+    O(iterations * M) time whatever the segments.
+    """
+    xs = segments[:, 0::2].astype(np.float64)
+    ys = segments[:, 1::2] - y_mid
+    lengths = np.hypot(xs[:, 1] - xs[:, 0], ys[:, 1] - ys[:, 0])
+    hypotheses = np.argsort(-lengths, kind='stable')[:iterations]
+    # x = a * y + b through both endpoints of each hypothesis segment
+    a = (xs[hypotheses, 1] - xs[hypotheses, 0]) / (ys[hypotheses, 1] - ys[hypotheses, 0])
+    b = xs[hypotheses, 0] - a * ys[hypotheses, 0]
+    # (hypotheses, segments, endpoints)
+    distances = np.abs(xs - (a[:, np.newaxis, np.newaxis] * ys + b[:, np.newaxis, np.newaxis]))
+    inliers = (distances <= threshold).all(axis=2)
+    best = np.argmax(inliers @ lengths)
+    return weighted_line_fit(segments[inliers[best]], y_mid)
+
+
+def fit_lanes(lines, y_mid, params=default_parameters):
+    """
+    Classifies Hough line segments by the slope bands of LaneParameters
+    `params` and fits a lane line to each side, as selected by params.fit:
+
+    'average'  the mean slope and x_mid of the segments (fit_lane_segments())
+    'lsq'      a least-squares line through the segment endpoints, weighted
+               by segment length (weighted_line_fit())
+    'ransac'   the same, without outlier segments (ransac_line_fit())
+
+    A least-squares line through segments far apart can get a slope outside
+    the band of its side, or even of the wrong sign; the mean of the segments
+    is used for that side instead.
+
+    Returns ((pos_slope, pos_x_mid), (neg_slope, neg_x_mid)), where a side is
+    None if no segment fell in its slope band.
+    """
+    if params.fit == 'average':
+        return fit_lane_segments(lines, y_mid, params.min_pos_slope, params.max_pos_slope,
+                                 params.min_neg_slope, params.max_neg_slope)
+    if params.fit not in ('lsq', 'ransac'):
+        raise ValueError('Unknown lane fit: {}'.format(params.fit))
+    classified = classify_lane_segments(lines, y_mid, params.min_pos_slope, params.max_pos_slope,
+                                        params.min_neg_slope, params.max_neg_slope)
+    if classified is None:
+        return None, None
+    segments, slopes, x_mids, pos, neg = classified
+    fits = []
+    for side, min_slope, max_slope in ((pos, params.min_pos_slope, params.max_pos_slope),
+                                       (neg, params.min_neg_slope, params.max_neg_slope)):
+        if not side.any():
+            fits.append(None)
+            continue
+        if params.fit == 'lsq':
+            fit = weighted_line_fit(segments[side], y_mid)
+        else:
+            fit = ransac_line_fit(segments[side], y_mid, params.ransac_iterations, params.ransac_threshold)
+        if fit is None or not min_slope <= fit[0] <= max_slope:
+            fit = (slopes[side].mean(), x_mids[side].mean())
+        fits.append(fit)
+    return tuple(fits)
+
+
+def lane_fits(lines, imshape, tracker=None, params=default_parameters):
+    """
+    `lines` are the line segments found by cv2.HoughLinesP in an image of shape
+    `imshape`. `tracker` is the LaneTracker (or KalmanLaneTracker) smoothing the
+    lane lines of the video the image comes from; the module default_tracker is
+    used if it is None. The segments are classified into lane sides and
+    fitted as set by LaneParameters `params` (see fit_lanes()).
+
+    Returns {'pos': (slope, x_mid), 'neg': (slope, x_mid)} of the smoothed lane
+    lines, with x_mid at 3/4 down the image. A side is None if no line
+    segments were found on it and the tracker does not predict it.
+    """
+    # calculate x_mids at y_mid within roi: at 3/4 down from top of image
+    y_mid = imshape[0] * 3/4
+    return track_lane_fits(fit_lanes(lines, y_mid, params), tracker)
+
+
+def track_lane_fits(measured, tracker=None):
+    """
+    Returns the smoothed lane lines {'pos': (slope, x_mid), 'neg': (slope,
+    x_mid)} after updating `tracker` (default_tracker if None) with the
+    `measured` lane lines (pos_fit, neg_fit) of a frame, as from fit_lanes().
+    A side that was not measured is predicted by the tracker, or None.
+    """
+    if tracker is None:
+        tracker = default_tracker
+    pos_fit, neg_fit = measured
+    return {'pos': tracker.predict('pos') if pos_fit is None else tracker.update(pos_fit[0], pos_fit[1], 'pos'),
+            'neg': tracker.predict('neg') if neg_fit is None else tracker.update(neg_fit[0], neg_fit[1], 'neg')}
+
+
+def lane_lines_from_fits(fits, imshape):
+    """
+    Returns the lane lines of `fits`, as returned by lane_fits() for an image
+    of shape `imshape`, as a list of [[x1, y1, x2, y2]] from the bottom of the
+    image up to 5/8 of its height, with one entry for each side in `fits`.
+    """
+    lines_new = []
+    y_mid = imshape[0] * 3/4
+    y1 = imshape[0] - 1
+    y2 = int(imshape[0]*5/8)
+    for side in ('pos', 'neg'):
+        if fits[side] is not None:
+            slope, x_mid = fits[side]
+            intercept = y_mid - slope * x_mid
+            x1 = int((y1 - intercept)/slope)
+            x2 = int((y2 - intercept)/slope)
+            lines_new.append([[x1, y1, x2, y2]])
+            # print("{} laneline: slope={:.2f}, x_mid={:.2f}, intercept={:.2f}:({:.2f},{:.2f})-({:.2f},{:.2f})".format(
+            #     side, slope, x_mid, intercept, x1,y1,x2,y2))
+    return lines_new
+
+
+def lane_lines_from_segments(lines, imshape, tracker=None, params=default_parameters):
+    """
+    `lines` are the line segments found by cv2.HoughLinesP in an image of shape
+    `imshape`. `tracker` is the LaneTracker (or KalmanLaneTracker) smoothing the
+    lane lines of the video the image comes from; the module default_tracker is
+    used if it is None.
+
+    Returns the smoothed lane lines as a list of [[x1, y1, x2, y2]], with one
+    entry for each side on which line segments were found or which the tracker
+    predicts. See lane_fits() for `params`.
+    """
+    return lane_lines_from_fits(lane_fits(lines, imshape, tracker, params), imshape)
+
+
+def lane_line_sides(lines):
+    """
+    Returns {'pos': [x1, y1, x2, y2], 'neg': [...]} for lane lines as returned
+    by lane_lines(), telling the sides apart by the sign of their slope.
+    """
+    sides = {}
+    for line in lines:
+        x1, y1, x2, y2 = line[0]
+        sides['pos' if (x2 - x1) * (y2 - y1) > 0 else 'neg'] = [x1, y1, x2, y2]
+    return sides
+
+
+# one frame of lane finding results; the fields of a side that was not found are NaN, and `detected` is False
+# for a frame that only had the lane lines of an earlier frame redrawn (see RealTimePipeline)
+LANE_RECORD_DTYPE = np.dtype([('frame', np.int64), ('detected', np.bool_), ('y1', np.int16), ('y2', np.int16),
+                              ('segments', np.uint16)] +
+                             [('{}_{}'.format(side, field), dtype) for side in ('pos', 'neg')
+                              for field, dtype in (('slope', np.float32), ('x_mid', np.float32),
+                                                   ('x1', np.float32), ('x2', np.float32),
+                                                   ('segments', np.uint16), ('confidence', np.float32))])
+
+
+def lane_record(fits, segments, imshape, frame=0, params=default_parameters, detected=True):
+    """
+    Returns a LANE_RECORD_DTYPE record of frame number `frame` of shape
+    `imshape`, with the lane line `fits` returned by lane_fits() for the Hough
+    line `segments` of the frame, classified by the slope bands of `params`.
+    With `detected` False, the fits and segments are those of an earlier
+    frame, whose lane lines were redrawn on this one.
+
+    The confidence of a side is the fraction of the rows of its lane line that
+    its segments cover; a predicted lane line has none.
+    """
+    record = np.zeros((), dtype=LANE_RECORD_DTYPE)
+    y_mid = imshape[0] * 3/4
+    y1 = imshape[0] - 1
+    y2 = int(imshape[0]*5/8)
+    record['frame'] = frame
+    record['detected'] = detected
+    record['y1'] = y1
+    record['y2'] = y2
+    record['segments'] = 0 if segments is None else len(segments)
+    classified = classify_lane_segments(segments, y_mid, params.min_pos_slope, params.max_pos_slope,
+                                        params.min_neg_slope, params.max_neg_slope)
+    for side in ('pos', 'neg'):
+        if fits[side] is None:
+            for field in ('slope', 'x_mid', 'x1', 'x2', 'confidence'):
+                record['{}_{}'.format(side, field)] = np.nan
+            continue
+        slope, x_mid = fits[side]
+        record[side + '_slope'] = slope
+        record[side + '_x_mid'] = x_mid
+        record[side + '_x1'] = x_mid + (y1 - y_mid) / slope
+        record[side + '_x2'] = x_mid + (y2 - y_mid) / slope
+        if classified is not None:
+            side_segments = classified[0][classified[3] if side == 'pos' else classified[4]]
+            covered = np.zeros(y1 - y2 + 1, dtype=bool)
+            for _, seg_y1, _, seg_y2 in side_segments:
+                covered[max(0, min(seg_y1, seg_y2) - y2):max(0, max(seg_y1, seg_y2) - y2 + 1)] = True
+            record[side + '_segments'] = len(side_segments)
+            record[side + '_confidence'] = covered.mean()
+    return record[()]
+
+
+def lane_lines(img, rho, theta, threshold, min_line_len, max_line_gap, tracker=None, params=default_parameters):
+    """
+    `img` should be the output of a Canny transform.
+    `tracker` is the LaneTracker smoothing the lane lines of the video `img` comes
+    from; the module default_tracker is used if it is None. The segments are
+    classified into lane sides by the slope bands of LaneParameters `params`.
+
+    Returns the smoothed lane lines found in `img` as a list of [[x1, y1, x2, y2]],
+    with one entry for each side on which line segments were found.
+    """
+    lines = cv2.HoughLinesP(img, rho, theta, threshold, np.array([]), minLineLength=min_line_len,
+                            maxLineGap=max_line_gap)
+    return lane_lines_from_segments(lines, img.shape, tracker, params)
+
+
+def hough_lines(img, rho, theta, threshold, min_line_len, max_line_gap, tracker=None, params=default_parameters):
+    """
+    `img` should be the output of a Canny transform.
+    `tracker` is the LaneTracker smoothing the lane lines of the video `img` comes
+    from; the module default_tracker is used if it is None. See lane_lines()
+    for `params`.
+
+    Returns an image with hough lines drawn.
+    """
+    line_img = np.zeros((img.shape[0], img.shape[1], 3), dtype=np.uint8)
+    lines_new = lane_lines(img, rho, theta, threshold, min_line_len, max_line_gap, tracker, params)
+    draw_lines(line_img, lines_new)
+    # cv2.imshow('before_lines', img)
+    # temp = np.zeros((img.shape[0], img.shape[1], 3), dtype=np.uint8)
+    # draw_lines(temp, lines)
+    # cv2.imshow('lines_original', temp)
+    # temp2 = np.zeros((img.shape[0], img.shape[1], 3), dtype=np.uint8)
+    # draw_lines(temp2, lines_new)
+    # cv2.imshow('lane_lines', temp2)
+    # cv2.waitKey(1000)
+    return line_img
+
+
+# Python 3 has support for cool math symbols.
+
+def weighted_img(img, initial_img, α=0.8, β=1., γ=0.):
+    """
+    `img` is the output of the hough_lines(), An image with lines drawn on it.
+    Should be a blank image (all black) with lines drawn on it.
+
+    `initial_img` should be the image before any processing.
+
+    The result image is computed as follows:
+
+    initial_img * α + img * β + γ
+    NOTE: initial_img and img must be the same shape!
+    """
+    return cv2.addWeighted(initial_img, α, img, β, γ)
+
+
+def lane_roi_vertices(imshape):
+    """
+    Returns the vertices of the four sided lane region of interest of an image
+    of shape `imshape`, from the bottom of the image up to 5/8 of its height.
+    """
+    return np.array([[(int(imshape[1]*1/16), int(imshape[0])),
+                      (int(imshape[1] * 7 / 16), int(imshape[0] * 5 / 8)),
+                      (int(imshape[1] * 9 / 16), int(imshape[0] * 5 / 8)),
+                      (int(imshape[1]*15/16), int(imshape[0]))]],
+                    dtype=np.int32)
+
+
+def lane_roi_top(imshape, kernel_size=default_parameters.kernel_size):
+    """
+    Returns the first row of an image of shape `imshape` that lane finding
+    processes: the top of the region of interest, less a margin for the blur
+    and Canny kernels of size `kernel_size`.
+    """
+    return max(0, int(lane_roi_vertices(imshape)[..., 1].min()) - 2 * kernel_size)
+
+
+def lane_edge_band(image, params=default_parameters, top=None, dst=None):
+    """
+    Returns (edges, top): the Canny edges of rows `top` and below of `image`,
+    masked to the lane region of interest, with the blur kernel size and Canny
+    thresholds of LaneParameters `params`. Only those rows are processed; `top`
+    is lane_roi_top() if None. The edges are written to `dst` if given.
+    """
+    # Define a kernel size for Gaussian smoothing
+    kernel_size = params.kernel_size
+    # This time we are defining a four sided polygon to mask
+    imshape = image.shape
+    vertices = lane_roi_vertices(imshape)
+    if top is None:
+        top = lane_roi_top(imshape, kernel_size)
+    # get gray scale first since all processing steps are on grayscale only
+    gray = grayscale(image[top:])
+    # apply Gaussian smoothing
+    blur_gray = gaussian_blur(gray, kernel_size)
+    # Define our parameters for Canny and apply
+    edges = canny(blur_gray, params.low_threshold, params.high_threshold)
+    # Next we'll mask the edges with the (cached) polygon mask
+    mask = roi_mask(imshape[:2], vertices)
+    return cv2.bitwise_and(edges, mask[top:], dst=dst), top
+
+
+def lane_edges(image, crop=True, params=default_parameters):
+    """
+    Returns the Canny edges of `image` masked to the lane region of interest,
+    as a full size image, with the blur kernel size and Canny thresholds of
+    LaneParameters `params`.
+
+    If `crop` is True, only the rows of the region of interest (and a margin
+    above it for the blur and Canny kernels) are processed; the rows above are
+    left at 0. The pipelines use lane_edge_band() instead, which returns those
+    rows only.
+    """
+    if not crop:
+        return lane_edge_band(image, params, top=0)[0]
+    masked_edges = np.zeros(image.shape[:2], dtype=np.uint8)
+    top = lane_roi_top(image.shape, params.kernel_size)
+    lane_edge_band(image, params, top, dst=masked_edges[top:])
+    return masked_edges
+
+
+def hough_segments(edges, top=0, params=default_parameters):
+    """
+    Returns the line segments cv2.HoughLinesP finds in `edges` with the Hough
+    parameters of LaneParameters `params`, as an (N,1,4) array or None. If
+    `edges` are the rows of an image from `top` down, the segments are moved
+    to the coordinates of the image.
+    """
+    segments = cv2.HoughLinesP(edges, params.rho, params.theta, params.threshold, np.array([]),
+                               minLineLength=params.min_line_length, maxLineGap=params.max_line_gap)
+    if segments is not None and top:
+        segments[..., 1::2] += top
+    return segments
+
+
+def lane_finding_pipeline(image, tracker=None, params=default_parameters):
+    # Hough runs on the rows of the region of interest only
+    masked_edges, top = lane_edge_band(image, params)
+    segments = hough_segments(masked_edges, top, params)
+    # Make a blank the same size as our image to draw on
+    line_image = np.zeros_like(image)
+    draw_lines(line_image, lane_lines_from_segments(segments, image.shape, tracker, params))
+    # Draw the lines on the original image
+    combo = weighted_img(line_image, image, 0.8, 1, 0)
+    return combo
+
+
+class StageProfiler():
+    """
+    Collects the time spent in each stage of LaneFindingPipeline for every
+    frame, and the number of Hough line segments per frame.
+
+    The pipeline calls start_frame() before its first stage and lap(stage)
+    after each stage; without a profiler it skips these calls entirely.
+    """
+
+    def __init__(self):
+        self.times = {}
+        self.segments = []
+        self.tic = None
+
+    def start_frame(self):
+        self.tic = time.perf_counter()
+
+    def lap(self, stage):
+        toc = time.perf_counter()
+        self.times.setdefault(stage, []).append(toc - self.tic)
+        self.tic = toc
+
+    def count_segments(self, lines):
+        self.segments.append(0 if lines is None else len(lines))
+
+    def frame_times(self):
+        """
+        Returns {stage: array of per-frame times in seconds}, including a 'total' stage.
+        """
+        frame_times = {stage: np.array(times) for stage, times in self.times.items()}
+        if frame_times:
+            frame_times['total'] = np.sum(list(frame_times.values()), axis=0)
+        return frame_times
+
+    def summary(self, percentiles=(50, 95, 99)):
+        """
+        Returns {stage: {'mean': ms, 'p50': ms, ...}} over all frames, with the
+        segment counts per frame summarized under 'segments'.
+        """
+        summary = {}
+        series = {stage: times * 1e3 for stage, times in self.frame_times().items()}
+        series['segments'] = np.array(self.segments)
+        for name, values in series.items():
+            if len(values) == 0:
+                continue
+            summary[name] = {'frames': len(values), 'mean': float(values.mean()), 'max': float(values.max())}
+            for percentile, value in zip(percentiles, np.percentile(values, percentiles)):
+                summary[name]['p{}'.format(percentile)] = float(value)
+        return summary
+
+    def save(self, path):
+        """
+        Writes the summary and the per-frame times (in ms) and segment counts
+        to `path`, as JSON or, if `path` ends in .csv, as one CSV row per frame.
+        """
+        frame_times = self.frame_times()
+        if path.endswith('.csv'):
+            with open(path, 'w', newline='') as csv_file:
+                writer = csv.writer(csv_file)
+                writer.writerow(['frame'] + ['{}_ms'.format(stage) for stage in frame_times] + ['segments'])
+                for frame, segments in enumerate(self.segments):
+                    writer.writerow([frame] + ['{:.4f}'.format(times[frame] * 1e3) for times in frame_times.values()]
+                                    + [segments])
+        else:
+            with open(path, 'w') as json_file:
+                json.dump({'summary': self.summary(),
+                           'frames': {stage: [round(t * 1e3, 4) for t in times] for stage, times in frame_times.items()},
+                           'segments': self.segments}, json_file, indent=1)
+
+    def print_summary(self):
+        for name, stats in self.summary().items():
+            unit = '' if name == 'segments' else ' ms'
+            print('{:>14}: p50 {:8.3f}{unit}  p95 {:8.3f}{unit}  p99 {:8.3f}{unit}  max {:8.3f}{unit}'.format(
+                name, stats['p50'], stats['p95'], stats['p99'], stats['max'], unit=unit))
+
+
+class LaneFindingPipeline():
+    """
+    lane_finding_pipeline() for a stream of frames that reuses its buffers.
+
+    The gray, blurred, edge and line mask images are allocated once per frame
+    resolution and handed to OpenCV as dst outputs, and the lane lines are drawn
+    straight onto the output frame instead of onto a blank image that is then
+    blended with it. The output frames are the same as lane_finding_pipeline().
+    detect() stops after the lane fit, for analysis that needs no output frames.
+
+    With `downscale` 2, 4, ... the grayscale region of interest is reduced
+    with an image pyramid, and blurring, Canny and Hough run at 1/`downscale`
+    of the resolution with their pixel sizes scaled to match. The Hough line
+    segments are mapped back to full resolution before they are fitted, so the
+    lane lines are smoothed and drawn at full resolution.
+
+    With `adaptive_roi`, the region of interest is narrowed to bands of
+    `roi_margin` pixels on either side of the lane lines of the previous frame,
+    so that Hough only votes on the edges near them. The full region of
+    interest is used again when a lane line was lost in the previous frame,
+    and every `roi_refresh` frames so that a wrong lane line cannot lock the
+    search in.
+
+    With `color_filter`, the region of interest is further limited to pixels
+    within `color_margin` pixels of a white or yellow one (see color_select()),
+    so that the edges of shadows, asphalt seams and guardrails do not reach
+    Hough.
+
+    The tuning parameters are taken from LaneParameters `params`.
+    If `profiler` is a StageProfiler, the time of each stage is recorded in it.
+    The lane lines found in the last frame are kept in `lines`, their slopes
+    and x_mids in `fits` and the Hough line segments in `segments`; record()
+    returns them as a compact record.
+    """
+
+    def __init__(self, tracker=None, params=default_parameters,
+                 color=(255, 0, 0), thickness=5, α=0.8, profiler=None, downscale=1,
+                 adaptive_roi=False, roi_margin=40, roi_refresh=30, color_filter=False, color_margin=4):
+        levels = int(round(math.log2(downscale))) if downscale >= 1 else -1
+        if levels < 0 or 2 ** levels != downscale:
+            raise ValueError('downscale must be a power of 2, got {}'.format(downscale))
+        self.tracker = LaneTracker() if tracker is None else tracker
+        self.profiler = profiler
+        self.downscale = downscale
+        self.levels = levels
+        self.params = params
+        self.kernel_size = params.kernel_size
+        self.low_threshold = params.low_threshold
+        self.high_threshold = params.high_threshold
+        self.rho = params.rho
+        self.theta = params.theta
+        self.threshold = params.threshold
+        self.min_line_length = params.min_line_length
+        self.max_line_gap = params.max_line_gap
+        self.color = tuple(color) + (0,) * (4 - len(color))
+        self.thickness = thickness
+        self.α = α
+        self.adaptive_roi = adaptive_roi
+        self.roi_margin = roi_margin
+        self.roi_refresh = roi_refresh
+        self.color_filter = color_filter
+        self.color_margin = color_margin
+        self.shape = None
+        self.lines = []
+        self.fits = {'pos': None, 'neg': None}
+        self.segments = None
+        # the sides found from segments in the last frame, not only predicted by the tracker
+        self.measured = set()
+        self.narrowed_frames = 0
+
+    def reset(self):
+        """
+        Forgets the lane lines of previous frames, to start on a new video or
+        an unrelated image.
+        """
+        self.tracker.clear()
+        self.lines = []
+        self.fits = {'pos': None, 'neg': None}
+        self.segments = None
+        self.measured = set()
+        self.narrowed_frames = 0
+
+    def record(self, frame=0, detected=True):
+        """
+        Returns the lane lines of the last frame processed as a record of
+        LANE_RECORD_DTYPE numbered `frame` (see lane_record()).
+        """
+        return lane_record(self.fits, self.segments, self.shape, frame, self.params, detected)
+
+    def allocate(self, imshape):
+        """
+        Allocates the buffers for frames of shape `imshape`.
+        """
+        height, width = imshape[:2]
+        vertices = lane_roi_vertices(imshape)
+        # only the rows of the region of interest (and a margin for the kernels) are processed
+        self.top = lane_roi_top(imshape, self.kernel_size)
+        self.gray = np.empty((height - self.top, width), dtype=np.uint8)
+        self.pyramid = []
+        for _ in range(self.levels):
+            band_height, band_width = (self.pyramid or [self.gray])[-1].shape
+            self.pyramid.append(np.empty(((band_height + 1) // 2, (band_width + 1) // 2), dtype=np.uint8))
+        if self.levels:
+            # the edges of the region of interest at reduced resolution, with parameters in reduced pixels
+            band = self.pyramid[-1]
+            band_vertices = ((vertices - (0, self.top)) / self.downscale).astype(np.int32)
+            self.mask = roi_mask(band.shape, band_vertices)
+            self.band_kernel_size = max(3, (self.kernel_size // self.downscale) | 1)
+            self.band_rho = max(1., self.rho / self.downscale)
+            self.band_threshold = max(1, int(round(self.threshold / self.downscale)))
+            self.band_min_line_length = self.min_line_length / self.downscale
+            self.band_max_line_gap = self.max_line_gap / self.downscale
+        else:
+            band = self.gray
+            self.mask = roi_mask((height, width), vertices)[self.top:]
+            self.band_kernel_size = self.kernel_size
+            self.band_rho = self.rho
+            self.band_threshold = self.threshold
+            self.band_min_line_length = self.min_line_length
+            self.band_max_line_gap = self.max_line_gap
+        self.blur_gray = np.empty_like(band)
+        self.edges = np.empty_like(band)
+        self.masked_edges = np.empty_like(band)
+        self.lane_mask = np.empty_like(band)
+        if self.color_filter:
+            # the colors are selected at the resolution of the edges
+            self.color_band = np.empty(band.shape + (3,), dtype=np.uint8)
+            self.hls = np.empty_like(self.color_band)
+            self.yellow = np.empty_like(band)
+            self.color_mask = np.empty_like(band)
+            margin = max(1, self.color_margin // self.downscale)
+            self.color_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2 * margin + 1, 2 * margin + 1))
+        # allocated when lane lines are first drawn, and redrawn only for new lane lines
+        self.line_mask = None
+        self.mask_lines = None
+        self.shape = imshape
+        self.lines = []
+        self.measured = set()
+
+    def lane_band_mask(self, lines):
+        """
+        Returns the region of interest narrowed to bands of `roi_margin` pixels
+        on either side of `lines`, for the processed band of the frame.
+        """
+        margin = self.roi_margin
+        polygons = np.array([[(x1 - margin, y1), (x2 - margin, y2), (x2 + margin, y2), (x1 + margin, y1)]
+                             for x1, y1, x2, y2 in lines], dtype=np.float64)
+        polygons = ((polygons - (0, self.top)) / self.downscale).astype(np.int32)
+        self.lane_mask.fill(0)
+        cv2.fillPoly(self.lane_mask, polygons, 255)
+        return cv2.bitwise_and(self.lane_mask, self.mask, dst=self.lane_mask)
+
+    def __call__(self, image, out=None):
+        """
+        Returns `image` with the lane lines drawn on it.
+
+        The result is written to `out` if given, which may be `image` itself to
+        process the frame in place without allocating anything for it.
+        """
+        self.detect(image)
+        profiler = self.profiler
+        self.draw_line_mask()
+        if profiler:
+            profiler.lap('draw')
+        out = self.redraw(image, out)
+        if profiler:
+            profiler.lap('blend')
+        return out
+
+    def detect(self, image):
+        """
+        Finds the lane lines in `image` without drawing them, for analysis that
+        only needs their geometry (see record()), and returns them.
+        """
+        profiler = self.profiler
+        if profiler:
+            profiler.start_frame()
+        if image.shape != self.shape:
+            self.allocate(image.shape)
+        cv2.cvtColor(image[self.top:], cv2.COLOR_RGB2GRAY, dst=self.gray)
+        if profiler:
+            profiler.lap('grayscale')
+        gray = self.gray
+        if self.levels:
+            for level in self.pyramid:
+                cv2.pyrDown(gray, dst=level, dstsize=(level.shape[1], level.shape[0]))
+                gray = level
+            if profiler:
+                profiler.lap('pyramid')
+        cv2.GaussianBlur(gray, (self.band_kernel_size, self.band_kernel_size), 0, dst=self.blur_gray)
+        if profiler:
+            profiler.lap('gaussian_blur')
+        cv2.Canny(self.blur_gray, self.low_threshold, self.high_threshold, edges=self.edges)
+        if profiler:
+            profiler.lap('canny')
+        mask = self.mask
+        if self.adaptive_roi:
+            # narrowed only around lane lines that were both found, not predicted by a Kalman tracker
+            if len(self.measured) == 2 and self.narrowed_frames < self.roi_refresh:
+                mask = self.lane_band_mask(lane_line_sides(self.lines).values())
+                self.narrowed_frames += 1
+            else:
+                self.narrowed_frames = 0
+        if self.color_filter:
+            color_band = image[self.top:]
+            if self.levels:
+                # bilinear averages neighbouring pixels much like INTER_AREA, which is slow for odd band sizes
+                color_band = cv2.resize(color_band, (self.hls.shape[1], self.hls.shape[0]), dst=self.color_band,
+                                        interpolation=cv2.INTER_LINEAR)
+            cv2.cvtColor(color_band, cv2.COLOR_RGB2HLS, dst=self.hls)
+            cv2.inRange(self.hls, *WHITE_HLS, dst=self.color_mask)
+            cv2.inRange(self.hls, *YELLOW_HLS, dst=self.yellow)
+            cv2.bitwise_or(self.color_mask, self.yellow, dst=self.color_mask)
+            cv2.dilate(self.color_mask, self.color_kernel, dst=self.color_mask)
+            mask = cv2.bitwise_and(self.color_mask, mask, dst=self.color_mask)
+            if profiler:
+                profiler.lap('color_filter')
+        cv2.bitwise_and(self.edges, mask, dst=self.masked_edges)
+        if profiler:
+            profiler.lap('roi_mask')
+        segments = cv2.HoughLinesP(self.masked_edges, self.band_rho, self.theta, self.band_threshold, np.array([]),
+                                   minLineLength=self.band_min_line_length, maxLineGap=self.band_max_line_gap)
+        if segments is not None:
+            # from the band (at reduced resolution) to the coordinates of the frame
+            if self.levels:
+                segments *= self.downscale
+            segments[..., 1::2] += self.top
+        if profiler:
+            profiler.lap('hough')
+            profiler.count_segments(segments)
+        self.segments = segments
+        measured = fit_lanes(segments, image.shape[0] * 3/4, self.params)
+        self.measured = {side for side, fit in zip(('pos', 'neg'), measured) if fit is not None}
+        self.fits = track_lane_fits(measured, self.tracker)
+        lines = self.lines = lane_lines_from_fits(self.fits, image.shape)
+        if profiler:
+            profiler.lap('fit')
+        return lines
+
+    def draw_line_mask(self):
+        """
+        Draws the lane lines of the last frame processed into `line_mask`,
+        unless they are drawn already.
+        """
+        if not self.lines or self.mask_lines is self.lines:
+            return
+        if self.line_mask is None:
+            self.line_mask = np.zeros(self.shape[:2], dtype=np.uint8)
+        self.line_mask.fill(0)
+        draw_lines(self.line_mask, self.lines, 255, self.thickness)
+        self.mask_lines = self.lines
+
+    def redraw(self, image, out=None):
+        """
+        Returns `image` with the lane lines of the last frame processed drawn on
+        it, without looking for lane lines in `image`, which must have the same
+        shape as that frame.
+        """
+        if out is None:
+            out = np.empty_like(image)
+        # same as weighted_img() with a blank line image: image * α, then add the line color under the lines
+        cv2.convertScaleAbs(image, dst=out, alpha=self.α)
+        if self.lines:
+            self.draw_line_mask()
+            cv2.add(out, self.color, dst=out, mask=self.line_mask)
+        return out
+
+
+class RealTimePipeline():
+    """
+    Runs LaneFindingPipeline `pipeline` on a video stream within `budget`
+    seconds per frame on average, for CPUs too slow to find the lane lines in
+    every frame.
+
+    The lane lines are only looked for in every `skip`th frame; the frames in
+    between get the tracked lane lines of the last detection redrawn, so the
+    tracker only advances on detections. `skip` follows the measured times of
+    a detection and a redraw, as the smallest that keeps the mean time per
+    frame within the budget, up to `max_skip`. A frame is detected anyway when
+    the last detection found no lane lines, or when the road region of the
+    frame differs from the last detected frame by more than `change_threshold`
+    levels per pixel and channel on average, measured on `thumbnail_size`
+    thumbnails.
+    """
+
+    def __init__(self, pipeline=None, budget=1 / 30, max_skip=8, change_threshold=8.,
+                 thumbnail_size=(64, 24), smoothing=0.1):
+        self.pipeline = LaneFindingPipeline() if pipeline is None else pipeline
+        self.budget = budget
+        self.max_skip = max_skip
+        self.change_threshold = change_threshold
+        self.thumbnail_size = thumbnail_size
+        self.smoothing = smoothing
+        self.skip = 1
+        self.since_detection = 0
+        self.detect_time = None
+        self.redraw_time = None
+        self.thumbnail = None
+        self.frames = 0
+        self.detections = 0
+
+    def _average(self, average, value):
+        # exponential moving average of the stage times
+        return value if average is None else average + self.smoothing * (value - average)
+
+    def __call__(self, image, out=None):
+        """
+        Returns `image` with the lane lines drawn on it, written to `out` if given.
+        """
+        tic = time.perf_counter()
+        pipeline = self.pipeline
+        if image.shape != pipeline.shape:
+            pipeline.allocate(image.shape)
+        # taken before `out` may overwrite `image`
+        thumbnail = cv2.resize(image[pipeline.top:], self.thumbnail_size, interpolation=cv2.INTER_AREA)
+        self.frames += 1
+        if (pipeline.lines and self.thumbnail is not None and self.since_detection + 1 < self.skip
+                and cv2.norm(thumbnail, self.thumbnail, cv2.NORM_L1) / thumbnail.size <= self.change_threshold):
+            out = pipeline.redraw(image, out)
+            self.since_detection += 1
+            self.redraw_time = self._average(self.redraw_time, time.perf_counter() - tic)
+            return out
+        out = pipeline(image, out)
+        self.thumbnail = thumbnail
+        self.detections += 1
+        self.since_detection = 0
+        self.detect_time = self._average(self.detect_time, time.perf_counter() - tic)
+        self.adapt()
+        return out
+
+    def record(self, frame=0):
+        """
+        Returns the lane lines of the last frame as a record of
+        LANE_RECORD_DTYPE numbered `frame`, with `detected` False if they were
+        only redrawn from the last detection.
+        """
+        return self.pipeline.record(frame, detected=self.since_detection == 0)
+
+    def adapt(self):
+        """
+        Sets `skip` from the measured times so that a detection followed by
+        skip - 1 redraws takes no more than `budget` per frame on average.
+        """
+        if self.redraw_time is None:
+            # not measured yet, skip a frame to measure it
+            self.skip = 2 if self.detect_time > self.budget else 1
+        elif self.detect_time <= self.budget:
+            self.skip = 1
+        elif self.redraw_time >= self.budget:
+            self.skip = self.max_skip
+        else:
+            self.skip = min(self.max_skip, math.ceil((self.detect_time - self.redraw_time) /
+                                                     (self.budget - self.redraw_time)))
@@ -0,0 +1,136 @@
+# coding: utf-8
+
+# Columnar storage of per-frame lane finding results.
+#
+# Usage:
+#   writer = LaneRecordWriter('solidWhiteRight.lanes')
+#   for index, frame in enumerate(frames):
+#       pipeline(frame)
+#       writer.write(pipeline.record(index))
+#   writer.close()
+#
+#   records = LaneRecords('solidWhiteRight.lanes')
+#   records[1000]                 # one frame, as a LANE_RECORD_DTYPE record
+#   records['pos_x1']             # one field of all frames, memory-mapped
+#
+# A record store is a directory with one raw little-endian file per field of
+# LANE_RECORD_DTYPE and a meta.json describing them. Records are buffered and
+# appended in chunks, so millions of frames are written with a few large writes,
+# and each field can be memory-mapped on its own for random access.
+
+import json
+import os
+
+import numpy as np
+
+META_FILE = 'meta.json'
+
+
+class LaneRecordWriter():
+    """
+    Appends lane records (see lane_core.lane_record()) to the record store `path`,
+    which is created or overwritten, `chunk_size` records at a time.
+    """
+
+    def __init__(self, path, chunk_size=65536):
+        from lane_core import LANE_RECORD_DTYPE
+
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, META_FILE)):
+            # overwritten, like an output video
+            os.remove(os.path.join(path, META_FILE))
+        self.path = path
+        self.dtype = LANE_RECORD_DTYPE.newbyteorder('<')
+        self.buffer = np.empty(chunk_size, dtype=self.dtype)
+        self.count = 0
+        self.frames = 0
+        self.files = {name: open(os.path.join(path, name + '.bin'), 'wb') for name in self.dtype.names}
+
+    def write(self, record):
+        self.buffer[self.count] = record
+        self.count += 1
+        if self.count == len(self.buffer):
+            self.flush()
+
+    def write_many(self, records):
+        """
+        Appends the structured array `records`.
+        """
+        for start in range(0, len(records), len(self.buffer)):
+            self.flush()
+            chunk = records[start:start + len(self.buffer)]
+            self.buffer[:len(chunk)] = chunk
+            self.count = len(chunk)
+        self.flush()
+
+    def flush(self):
+        for name, column_file in self.files.items():
+            column_file.write(self.buffer[name][:self.count].tobytes())
+        self.frames += self.count
+        self.count = 0
+
+    def close(self, complete=True):
+        """
+        Writes the buffered records and closes the store. With `complete`
+        False, as when writing failed, the records written are kept but no
+        meta.json is written, so the store cannot be opened as complete.
+        """
+        self.flush()
+        for column_file in self.files.values():
+            column_file.close()
+        if not complete:
+            return
+        # written last, so an interrupted store is not mistaken for a complete one
+        with open(os.path.join(self.path, META_FILE), 'w') as meta_file:
+            json.dump({'frames': self.frames, 'fields': [[name, self.dtype[name].str] for name in self.dtype.names]},
+                      meta_file, indent=1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(complete=exc_type is None)
+
+
+class LaneRecords():
+    """
+    The lane records of the record store `path`, memory-mapped.
+
+    records[name] is the column of field `name` for all frames, records[i] (or
+    records[i:j]) is a record (or structured array of records) read from all
+    columns.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, META_FILE)) as meta_file:
+            meta = json.load(meta_file)
+        self.path = path
+        self.dtype = np.dtype([(name, dtype) for name, dtype in meta['fields']])
+        self.frames = meta['frames']
+        self.columns = {name: np.memmap(os.path.join(path, name + '.bin'), dtype=self.dtype[name], mode='r',
+                                        shape=(self.frames,)) if self.frames else np.empty(0, self.dtype[name])
+                        for name in self.dtype.names}
+
+    def __len__(self):
+        return self.frames
+
+    def __getitem__(self, index):
+        if isinstance(index, str):
+            return self.columns[index]
+        if isinstance(index, slice):
+            records = np.empty(len(range(*index.indices(self.frames))), dtype=self.dtype)
+        else:
+            if index < 0:
+                index += self.frames
+            if not 0 <= index < self.frames:
+                raise IndexError('Frame {} out of range for {} frames'.format(index, self.frames))
+            records = np.empty((), dtype=self.dtype)
+        for name, column in self.columns.items():
+            records[name] = column[index]
+        return records if isinstance(index, slice) else records[()]
+
+    def to_array(self):
+        """
+        Returns all records as one structured array in memory.
+        """
+        return self[:]
@@ -0,0 +1,276 @@
+# coding: utf-8
+
+# Lane finding for several camera streams in one process.
+#
+# Usage:
+#   python lane_service.py test_videos/solidWhiteRight.mp4 synthetic synthetic --realtime
+#   python lane_service.py 0 1 --jobs 2 --max-frames 600 --records lanes/
+#
+# Every stream is read by its own asyncio task and gets its own
+# LaneFindingPipeline, so each keeps its own moving averages, while the lane
+# finding itself runs on a thread pool shared by all streams (OpenCV releases
+# the GIL). The frames of a stream are processed in order, one at a time.
+#
+# A live stream (a capture device, or any source with --realtime) does not wait
+# for lane finding: while a frame is being processed, only the newest frame
+# read meanwhile is kept and older ones are dropped, so that latency stays
+# bounded when the pool cannot keep up. Files and synthetic streams are
+# otherwise read as fast as they are processed, without dropping frames.
+#
+# Frame counts, dropped frames, frame rate and latency (from reading a frame
+# to its lane lines) of every stream are printed every --report-interval seconds.
+
+import argparse
+import asyncio
+import collections
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from lane_stream import open_source
+
+
+class SyntheticSource():
+    """
+    Generated RGB frames of a straight road with two lane lines swaying from
+    side to side, for testing without a camera. Yields `frames` frames, or
+    frames forever if None.
+    """
+
+    def __init__(self, width=960, height=540, frames=300, fps=25., seed=None):
+        self.width = width
+        self.height = height
+        self.frames = frames
+        self.fps = fps
+        self.random = np.random.default_rng(seed)
+        self.phase = self.random.uniform(0, 2 * np.pi)
+
+    def __iter__(self):
+        index = 0
+        while self.frames is None or index < self.frames:
+            frame = np.empty((self.height, self.width, 3), dtype=np.uint8)
+            frame[:] = (90, 90, 95)
+            frame[:self.height * 5 // 8] = (150, 180, 210)
+            shift = 0.03 * self.width * np.sin(self.phase + 2 * np.pi * index / (4 * self.fps))
+            top = self.height * 5 // 8
+            for bottom_x, top_x in ((0.15, 0.46), (0.85, 0.54)):
+                cv2.line(frame, (int(bottom_x * self.width + shift), self.height - 1),
+                         (int(top_x * self.width + shift / 4), top), (240, 240, 240), 8)
+            noise = self.random.integers(0, 12, size=frame.shape, dtype=np.uint8)
+            yield '{:06d}'.format(index), cv2.add(frame, noise, dst=frame)
+            index += 1
+
+    def close(self):
+        pass
+
+
+def open_service_source(source):
+    """
+    Returns the frame source for `source`: 'synthetic' for a SyntheticSource,
+    otherwise as lane_stream.open_source().
+    """
+    if source == 'synthetic':
+        return SyntheticSource()
+    return open_source(source)
+
+
+class StreamStats():
+    """
+    Counters of one stream: frames read, processed and dropped, and the
+    latencies of the last `window` processed frames.
+    """
+
+    def __init__(self, window=300):
+        self.read = 0
+        self.processed = 0
+        self.dropped = 0
+        self.latencies = collections.deque(maxlen=window)
+        self.start = time.perf_counter()
+
+    def summary(self):
+        latencies = np.array(self.latencies) * 1e3
+        p50, p95, max_latency = (np.percentile(latencies, 50), np.percentile(latencies, 95), latencies.max()) \
+            if len(latencies) else (0., 0., 0.)
+        elapsed = time.perf_counter() - self.start
+        return {'read': self.read, 'processed': self.processed, 'dropped': self.dropped,
+                'fps': self.processed / elapsed if elapsed else 0.,
+                'latency_p50_ms': float(p50), 'latency_p95_ms': float(p95), 'latency_max_ms': float(max_latency)}
+
+
+class LaneService():
+    """
+    Finds the lane lines in several frame streams concurrently on a pool of
+    `jobs` threads (the number of cores if None).
+
+    Streams are added with add_stream() and processed by run(). `on_lanes`, if
+    given, is called as on_lanes(stream name, frame index, pipeline) after
+    each processed frame, with the stream's LaneFindingPipeline holding its
+    lane lines.
+    """
+
+    def __init__(self, jobs=None, on_lanes=None):
+        self.pool = ThreadPoolExecutor(max_workers=jobs or os.cpu_count(), thread_name_prefix='lanes')
+        self.on_lanes = on_lanes
+        self.streams = {}
+
+    def add_stream(self, name, source, live=False, paced=False, max_frames=None, pipeline=None):
+        """
+        Adds the frame source `source` as stream `name`. A live stream (such
+        as a capture device) is read at its own rate and drops the frames the
+        pool has no time for; a paced one is also read no faster than its
+        frame rate, to play a file back like a camera. The stream stops after
+        `max_frames` frames if given. `pipeline` is the LaneFindingPipeline of
+        the stream, a new one if None.
+        """
+        from lane_core import LaneFindingPipeline
+
+        if name in self.streams:
+            raise ValueError('Duplicate stream name: {}'.format(name))
+        self.streams[name] = {'source': source, 'live': live or paced, 'paced': paced, 'max_frames': max_frames,
+                              'pipeline': LaneFindingPipeline() if pipeline is None else pipeline,
+                              'stats': StreamStats()}
+
+    def stats(self):
+        return {name: stream['stats'].summary() for name, stream in self.streams.items()}
+
+    async def _read(self, stream, pending):
+        # reads frames on a thread of the default executor, as the reads block
+        loop = asyncio.get_running_loop()
+        source, stats = stream['source'], stream['stats']
+        frames = iter(source)
+        interval = 1. / source.fps
+        next_time = time.perf_counter()
+        read = None
+        try:
+            while stream['max_frames'] is None or stats.read < stream['max_frames']:
+                read = loop.run_in_executor(None, next, frames, None)
+                # shielded, so that a cancelled task still knows when the thread is done with the source
+                item = await asyncio.shield(read)
+                if item is None:
+                    break
+                stats.read += 1
+                if stream['live']:
+                    if pending.full():
+                        pending.get_nowait()
+                        stats.dropped += 1
+                    pending.put_nowait((stats.read - 1, time.perf_counter(), item[1]))
+                    if stream['paced']:
+                        next_time += interval
+                        await asyncio.sleep(max(0., next_time - time.perf_counter()))
+                else:
+                    await pending.put((stats.read - 1, time.perf_counter(), item[1]))
+            # the end of the stream, after the frames still pending
+            await pending.put(None)
+        finally:
+            # not closed under a read still running on its thread, even if cancelled again meanwhile
+            while read is not None and not read.done():
+                try:
+                    await asyncio.wait([read])
+                except asyncio.CancelledError:
+                    pass
+            source.close()
+
+    async def _process(self, name, stream, pending):
+        loop = asyncio.get_running_loop()
+        pipeline, stats = stream['pipeline'], stream['stats']
+        while True:
+            item = await pending.get()
+            if item is None:
+                break
+            index, read_time, frame = item
+            await loop.run_in_executor(self.pool, pipeline.detect, frame)
+            stats.latencies.append(time.perf_counter() - read_time)
+            stats.processed += 1
+            if self.on_lanes:
+                self.on_lanes(name, index, pipeline)
+
+    async def _report(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            print_stats(self.stats())
+
+    async def run(self, report_interval=None):
+        """
+        Processes all streams until every one has ended, printing their
+        statistics every `report_interval` seconds if given. Returns the
+        final statistics per stream.
+        """
+        tasks = []
+        for name, stream in self.streams.items():
+            # a single slot for live streams, so that only the newest frame waits
+            pending = asyncio.Queue(maxsize=1 if stream['live'] else 4)
+            stream['stats'].start = time.perf_counter()
+            tasks += [asyncio.ensure_future(self._read(stream, pending)),
+                      asyncio.ensure_future(self._process(name, stream, pending))]
+        reporter = asyncio.ensure_future(self._report(report_interval)) if report_interval else None
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            if reporter:
+                reporter.cancel()
+            # until the sources are closed, after a stream failed or the service was cancelled
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.pool.shutdown(wait=True)
+        return self.stats()
+
+
+def print_stats(stats):
+    for name, summary in stats.items():
+        print('{:<30} {:6d} read {:6d} processed {:5d} dropped {:6.1f} fps  latency p50 {:6.1f} ms  '
+              'p95 {:6.1f} ms  max {:6.1f} ms'.format(
+                  name, summary['read'], summary['processed'], summary['dropped'], summary['fps'],
+                  summary['latency_p50_ms'], summary['latency_p95_ms'], summary['latency_max_ms']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Find lane lines in several video streams concurrently.')
+    parser.add_argument('sources', nargs='+',
+                        help="video files, directories of images, capture device indexes or 'synthetic'")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='lane finding threads (default: number of cores)')
+    parser.add_argument('--realtime', action='store_true',
+                        help='play files and synthetic streams at their frame rate, dropping frames like a camera')
+    parser.add_argument('--max-frames', type=int, default=None, help='stop each stream after this many frames')
+    parser.add_argument('--report-interval', type=float, default=1., help='seconds between statistics (default: %(default)s)')
+    parser.add_argument('--records', metavar='DIR', default=None,
+                        help='write the lane lines of each stream to DIR/STREAM.lanes (see lane_records.py)')
+    args = parser.parse_args(argv)
+
+    # streams are named after their source, numbered if a source is given twice
+    names = []
+    for source in args.sources:
+        name = os.path.basename(source.rstrip('/')) or source
+        count = sum(other == name or other.startswith(name + '#') for other in names)
+        names.append(name if not count else '{}#{}'.format(name, count + 1))
+    writers = {}
+    if args.records:
+        from lane_records import LaneRecordWriter
+
+        os.makedirs(args.records, exist_ok=True)
+        writers = {name: LaneRecordWriter(os.path.join(args.records, name + '.lanes')) for name in names}
+
+    def on_lanes(name, index, pipeline):
+        if writers:
+            writers[name].write(pipeline.record(index))
+
+    service = LaneService(args.jobs, on_lanes)
+    for name, source in zip(names, args.sources):
+        service.add_stream(name, open_service_source(source), live=source.isdigit(),
+                           paced=args.realtime and not source.isdigit(), max_frames=args.max_frames)
+    complete = False
+    try:
+        stats = asyncio.run(service.run(args.report_interval))
+        complete = True
+    finally:
+        for writer in writers.values():
+            writer.close(complete)
+    print('final:')
+    print_stats(stats)
+
+
+if __name__ == '__main__':
+    main()
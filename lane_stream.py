@@ -0,0 +1,301 @@
+# coding: utf-8
+
+# Streaming lane finding: decode, lane finding and encode run on separate
+# threads joined by bounded queues, so reading and writing frames overlaps with
+# the pipeline while at most a fixed number of frames is in flight.
+#
+# Usage:
+#   python lane_stream.py test_videos/solidWhiteRight.mp4 test_videos_output/solidWhiteRight.mp4
+#   python lane_stream.py test_images/ test_images_output/
+#   python lane_stream.py 0 camera.mp4 --max-frames 300
+#
+# A source is a video file, a directory of images (processed in name order as
+# one stream) or the index of a capture device. Frames are passed on in RGB
+# order, as moviepy does, and converted back to BGR for OpenCV's writers.
+
+import argparse
+import itertools
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+class VideoSource():
+    """
+    Frames of a video file or, if `source` is an int, a capture device.
+    """
+
+    def __init__(self, source):
+        self.capture = cv2.VideoCapture(source)
+        if not self.capture.isOpened():
+            raise IOError('Cannot open video source: {}'.format(source))
+        fps = self.capture.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if fps > 0 else 25.
+
+    def __iter__(self):
+        index = 0
+        while True:
+            ok, frame = self.capture.read()
+            if not ok:
+                break
+            yield '{:06d}'.format(index), cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
+            index += 1
+
+    def close(self):
+        self.capture.release()
+
+
+class ImageDirSource():
+    """
+    The images in directory `path`, in file name order.
+    """
+    fps = 25.
+
+    def __init__(self, path, extensions=IMAGE_EXTENSIONS):
+        self.paths = [os.path.join(path, filename) for filename in sorted(os.listdir(path))
+                      if os.path.splitext(filename)[1].lower() in extensions]
+
+    def __iter__(self):
+        for path in self.paths:
+            frame = cv2.imread(path)
+            if frame is None:
+                raise IOError('Cannot read image: {}'.format(path))
+            yield os.path.basename(path), cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
+
+    def close(self):
+        pass
+
+
+class VideoSink():
+    """
+    Writes frames to the video file `path`; the frame size is taken from the
+    first frame.
+    """
+
+    def __init__(self, path, fps, fourcc='mp4v'):
+        self.path = path
+        self.fps = fps
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        self.writer = None
+
+    def write(self, name, frame):
+        if self.writer is None:
+            self.writer = cv2.VideoWriter(self.path, self.fourcc, self.fps, (frame.shape[1], frame.shape[0]))
+            if not self.writer.isOpened():
+                raise IOError('Cannot open video for writing: {}'.format(self.path))
+        self.writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR, dst=frame))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+
+
+class ImageDirSink():
+    """
+    Writes each frame to directory `path` as an image named after the frame,
+    with extension `ext` if the frame name has none.
+    """
+
+    def __init__(self, path, ext='.jpg'):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.ext = ext
+
+    def write(self, name, frame):
+        if not os.path.splitext(name)[1]:
+            name += self.ext
+        cv2.imwrite(os.path.join(self.path, name), cv2.cvtColor(frame, cv2.COLOR_RGB2BGR, dst=frame))
+
+    def close(self):
+        pass
+
+
+def open_source(source):
+    """
+    Returns the frame source for `source`: a capture device index (an int or
+    a string of digits), a directory of images or a video file.
+    """
+    if isinstance(source, int) or source.isdigit():
+        return VideoSource(int(source))
+    if os.path.isdir(source):
+        return ImageDirSource(source)
+    return VideoSource(source)
+
+
+def open_sink(destination, fps):
+    """
+    Returns the frame sink for `destination`: a video file if it has a video
+    extension, otherwise a directory of images.
+    """
+    if os.path.splitext(destination)[1].lower() in ('.mp4', '.avi', '.mov', '.mkv'):
+        return VideoSink(destination, fps)
+    return ImageDirSink(destination)
+
+
+_end_of_stream = object()
+
+
+def _put(frame_queue, item, stop):
+    # block while the queue is full, but give up once the stream is stopped
+    while not stop.is_set():
+        try:
+            frame_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(frame_queue, stop):
+    while not stop.is_set():
+        try:
+            return frame_queue.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return _end_of_stream
+
+
+def stream(source, sink, process_frame, queue_size=8, max_frames=None):
+    """
+    Reads frames from `source` on a decoder thread, runs `process_frame` on
+    them on the calling thread and writes the results to `sink` on an encoder
+    thread. The stages are joined by queues of `queue_size` frames, so a slow
+    stage holds the others back and memory use stays bounded.
+
+    `process_frame(frame)` gets an RGB frame it may modify and returns the
+    frame to write. Stops after `max_frames` frames if given, which is needed
+    for a live capture device. Returns (number of frames, runtime in seconds).
+    An exception in any stage stops the stream and is raised here.
+    """
+    decoded = queue.Queue(maxsize=queue_size)
+    processed = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+
+    def decode():
+        try:
+            # limited before reading, so that no frame is read from a capture device only to be dropped
+            for item in itertools.islice(source, max_frames):
+                if not _put(decoded, item, stop):
+                    break
+        except Exception as error:
+            errors.append(error)
+            stop.set()
+        finally:
+            _put(decoded, _end_of_stream, stop)
+
+    def encode():
+        try:
+            while True:
+                item = _get(processed, stop)
+                if item is _end_of_stream:
+                    break
+                sink.write(*item)
+        except Exception as error:
+            errors.append(error)
+            stop.set()
+
+    threads = [threading.Thread(target=decode, name='decode', daemon=True),
+               threading.Thread(target=encode, name='encode', daemon=True)]
+    n_frames = 0
+    tic = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            item = _get(decoded, stop)
+            if item is _end_of_stream:
+                break
+            name, frame = item
+            if not _put(processed, (name, process_frame(frame)), stop):
+                break
+            n_frames += 1
+        _put(processed, _end_of_stream, stop)
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        for thread in threads:
+            thread.join()
+        source.close()
+        sink.close()
+    if errors:
+        raise errors[0]
+    return n_frames, time.perf_counter() - tic
+
+
+def main(argv=None):
+    from lane_records import LaneRecordWriter
+    from lane_core import KalmanLaneTracker, LaneFindingPipeline, RealTimePipeline, StageProfiler, default_parameters
+
+    parser = argparse.ArgumentParser(description='Find lane lines in a video, image directory or camera stream.')
+    parser.add_argument('source', help='video file, directory of images or capture device index')
+    parser.add_argument('destination', help='output video file (.mp4, .avi, ...) or directory of images')
+    parser.add_argument('--queue-size', type=int, default=8,
+                        help='frames buffered between decoding, processing and encoding (default: %(default)s)')
+    parser.add_argument('--max-frames', type=int, default=None, help='stop after this many frames')
+    parser.add_argument('--profile', metavar='PATH', default=None,
+                        help='time each pipeline stage and write the per-frame times to PATH (.json or .csv)')
+    parser.add_argument('--downscale', type=int, default=1, choices=(1, 2, 4, 8),
+                        help='find edges and lines at 1/DOWNSCALE of the resolution (default: %(default)s)')
+    parser.add_argument('--adaptive-roi', action='store_true',
+                        help='search for lane lines near those of the previous frame only')
+    parser.add_argument('--color-filter', action='store_true',
+                        help='only look for lane lines among white and yellow pixels')
+    parser.add_argument('--kalman', action='store_true',
+                        help='smooth the lane lines with a Kalman filter instead of moving averages')
+    parser.add_argument('--fit', default=default_parameters.fit, choices=('average', 'lsq', 'ransac'),
+                        help='how the line segments of a lane side are fitted: by averaging them, by length-weighted '
+                             'least squares, or by the same without outliers (default: %(default)s)')
+    parser.add_argument('--budget', type=float, metavar='MS', default=None,
+                        help='real-time mode: only look for lane lines in as many frames as fit in MS milliseconds '
+                             'per frame on average, and redraw the last ones in the others')
+    parser.add_argument('--records', metavar='PATH', default=None,
+                        help='write the lane lines of every frame to the record store PATH (see lane_records.py)')
+    args = parser.parse_args(argv)
+
+    source = open_source(args.source)
+    sink = open_sink(args.destination, source.fps)
+    profiler = StageProfiler() if args.profile else None
+    tracker = KalmanLaneTracker() if args.kalman else None
+    pipeline = LaneFindingPipeline(tracker, default_parameters._replace(fit=args.fit), profiler=profiler,
+                                   downscale=args.downscale, adaptive_roi=args.adaptive_roi,
+                                   color_filter=args.color_filter)
+    if args.budget is not None:
+        realtime = pipeline = RealTimePipeline(pipeline, budget=args.budget / 1e3)
+    writer = LaneRecordWriter(args.records) if args.records else None
+    frame_index = 0
+
+    def process_frame(frame):
+        nonlocal frame_index
+        # draw on the decoded frame itself, it is not used after processing
+        frame = pipeline(frame, out=frame)
+        if writer:
+            # marked as not detected in the frames the RealTimePipeline only redraws
+            writer.write(pipeline.record(frame_index))
+        frame_index += 1
+        return frame
+
+    complete = False
+    try:
+        n_frames, runtime = stream(source, sink, process_frame, args.queue_size, args.max_frames)
+        complete = True
+    finally:
+        if writer:
+            writer.close(complete)
+    print('{}: {} frames in {:.2f} s, {:.1f} fps'.format(args.source, n_frames, runtime, n_frames / runtime))
+    if args.budget is not None:
+        print('lane lines looked for in {} of {} frames, every {} frames at the end'.format(
+            realtime.detections, realtime.frames, realtime.skip))
+    if profiler:
+        profiler.print_summary()
+        profiler.save(args.profile)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+# coding: utf-8
+
+# Headless batch lane finding over many images on a pool of threads.
+#
+# Usage:
+#   python process_images.py test_images/ -o test_images_output/
+#   python process_images.py 'dashcam/**/*.jpg' -o output/ -j 8
+#
+# Every image is processed on its own (its moving averages are cleared first).
+# The annotated images are written to the output directory under the same path
+# relative to the directory or glob pattern they were found in, so that images
+# with the same name in different folders do not overwrite each other, and the
+# lane lines of every image to a CSV file. OpenCV releases the
+# GIL while decoding, processing and encoding, so threads keep all cores and the
+# disk busy; at most a fixed number of images is in flight at any time.
+
+import argparse
+import collections
+import csv
+import glob
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+CSV_FIELDS = ['image', 'pos_x1', 'pos_y1', 'pos_x2', 'pos_y2', 'neg_x1', 'neg_y1', 'neg_x2', 'neg_y2', 'error']
+
+_local = threading.local()
+
+
+def _glob_root(pattern):
+    # the directory part of `pattern` before its first wildcard
+    parts = os.path.normpath(pattern).split(os.sep)
+    prefix = []
+    for part in parts[:-1]:
+        if glob.has_magic(part):
+            break
+        prefix.append(part)
+    if prefix == ['']:
+        return os.sep
+    return os.sep.join(prefix) or os.curdir
+
+
+def find_images(inputs, extensions=IMAGE_EXTENSIONS):
+    """
+    Yields (image file, path relative to its input) for the image files given
+    by `inputs`: image files, directories (not searched recursively) and glob
+    patterns, which may use ** for recursion. The path of an image in a
+    directory is its file name, that of an image matched by a pattern is
+    relative to the directory before the first wildcard of the pattern, and
+    that of an image file is its file name.
+    """
+    for path in inputs:
+        if os.path.isdir(path):
+            with os.scandir(path) as entries:
+                filenames = sorted(entry.name for entry in entries if entry.is_file())
+            for filename in filenames:
+                if os.path.splitext(filename)[1].lower() in extensions:
+                    yield os.path.join(path, filename), filename
+        elif glob.has_magic(path):
+            root = _glob_root(path)
+            for filename in sorted(glob.iglob(path, recursive=True)):
+                if os.path.splitext(filename)[1].lower() in extensions:
+                    yield filename, os.path.relpath(filename, root)
+        elif os.path.isfile(path):
+            yield path, os.path.basename(path)
+        else:
+            raise FileNotFoundError('No such image, directory or pattern: {}'.format(path))
+
+
+def process_image_file(input_path, output_path=None):
+    """
+    Finds the lane lines in the image `input_path`, writes the annotated image
+    to `output_path` unless it is None and returns the lane lines.
+
+    Each thread keeps its own LaneFindingPipeline, so buffers are reused from
+    image to image.
+    """
+    from lane_core import LaneFindingPipeline
+
+    pipeline = getattr(_local, 'pipeline', None)
+    if pipeline is None:
+        pipeline = _local.pipeline = LaneFindingPipeline()
+    image = cv2.imread(input_path)
+    if image is None:
+        raise IOError('Cannot read image: {}'.format(input_path))
+    pipeline.reset()
+    # the pipeline works on RGB frames, like the videos from moviepy
+    cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+    pipeline(image, out=image)
+    if output_path is not None:
+        cv2.cvtColor(image, cv2.COLOR_RGB2BGR, dst=image)
+        if not cv2.imwrite(output_path, image):
+            raise IOError('Cannot write image: {}'.format(output_path))
+    return pipeline.lines
+
+
+def process_images(images, output_dir, csv_path=None, jobs=None):
+    """
+    Processes `images`, (image file, relative path) pairs as from
+    find_images(), on `jobs` threads (the number of cores if None), writing
+    each annotated image to its relative path in `output_dir` and one row of
+    lane line endpoints per image to `csv_path` (lanes.csv in `output_dir` if
+    None), in input order.
+
+    Raises ValueError before processing anything if an image would be
+    written over its input or two images to the same path. An image that fails is reported and recorded in
+    the CSV file, and does not stop the batch. Returns (number of images,
+    number of failures, runtime).
+    """
+    from lane_core import lane_line_sides
+
+    images = list(images)
+    seen = {}
+    for image, relative_path in images:
+        output_path = os.path.normpath(os.path.join(output_dir, relative_path))
+        if os.path.abspath(output_path) == os.path.abspath(image):
+            raise ValueError('Output would overwrite input image: {}'.format(image))
+        if output_path in seen:
+            raise ValueError('Images {} and {} would both be written to {}'.format(seen[output_path], image,
+                                                                                output_path))
+        seen[output_path] = image
+    os.makedirs(output_dir, exist_ok=True)
+    if csv_path is None:
+        csv_path = os.path.join(output_dir, 'lanes.csv')
+    jobs = jobs or os.cpu_count()
+    max_in_flight = 4 * jobs
+    n_images = 0
+    n_failed = 0
+    tic = time.perf_counter()
+    with open(csv_path, 'w', newline='') as csv_file, ThreadPoolExecutor(max_workers=jobs) as executor:
+        writer = csv.DictWriter(csv_file, CSV_FIELDS)
+        writer.writeheader()
+        in_flight = collections.deque()
+
+        def write_row():
+            nonlocal n_images, n_failed
+            image, future = in_flight.popleft()
+            row = {'image': image}
+            try:
+                for side, line in lane_line_sides(future.result()).items():
+                    row.update(('{}_{}'.format(side, coordinate), value)
+                               for coordinate, value in zip(('x1', 'y1', 'x2', 'y2'), line))
+            except Exception as error:
+                row['error'] = str(error)
+                n_failed += 1
+                print('{}: {}'.format(image, error), file=sys.stderr)
+            writer.writerow(row)
+            n_images += 1
+
+        for image, relative_path in images:
+            output_path = os.path.join(output_dir, relative_path)
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            in_flight.append((image, executor.submit(process_image_file, image, output_path)))
+            if len(in_flight) >= max_in_flight:
+                write_row()
+        while in_flight:
+            write_row()
+    return n_images, n_failed, time.perf_counter() - tic
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Find lane lines in a batch of images, without a display.')
+    parser.add_argument('inputs', nargs='+', help='image files, directories of images or glob patterns')
+    parser.add_argument('-o', '--output-dir', default='test_images_output',
+                        help='directory to write the annotated images to (default: %(default)s)')
+    parser.add_argument('--csv', default=None, help='file to write the lane lines to (default: OUTPUT_DIR/lanes.csv)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of threads (default: number of cores)')
+    args = parser.parse_args(argv)
+
+    try:
+        n_images, n_failed, runtime = process_images(find_images(args.inputs), args.output_dir, args.csv, args.jobs)
+    except ValueError as error:
+        parser.error(str(error))
+    print('{} images ({} failed) in {:.2f} s, {:.1f} images/s'.format(
+        n_images, n_failed, runtime, n_images / runtime if runtime else 0.))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+# coding: utf-8
+
+# Batch lane finding over many videos, spread over a pool of worker processes.
+#
+# Usage:
+#   python process_videos.py test_videos/ -o test_videos_output/ -j 4
+#   python process_videos.py a.mp4 b.mp4 --jobs 2
+#   python process_videos.py long.mp4 --chunks 8
+#   python process_videos.py test_videos/ -o lanes/ --analyze
+#
+# Every video gets its own LaneFindingPipeline (and with it its own LaneTracker),
+# so moving averages never leak between videos processed by the same worker.
+# With --chunks, each video is instead cut into time chunks processed in
+# parallel and stitched back together. With --analyze, no video is written: the
+# lane lines of every frame are stored as records (see lane_records.py) without
+# drawing, blending or encoding anything.
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+
+
+def find_videos(inputs, extensions=VIDEO_EXTENSIONS):
+    """
+    Expands `inputs`, a list of video files and directories, into a sorted
+    list of video files. Directories are searched (not recursively) for files
+    with one of `extensions`.
+    """
+    videos = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for filename in sorted(os.listdir(path)):
+                if os.path.splitext(filename)[1].lower() in extensions:
+                    videos.append(os.path.join(path, filename))
+        elif os.path.isfile(path):
+            videos.append(path)
+        else:
+            raise FileNotFoundError('No such video or directory: {}'.format(path))
+    return videos
+
+
+def process_video(input_path, output_path):
+    """
+    Runs the lane finding pipeline over all frames of `input_path` and writes
+    the result to `output_path`.
+
+    Returns (input_path, number of frames, runtime in seconds).
+    """
+    from moviepy.editor import VideoFileClip
+    from lane_core import LaneFindingPipeline
+
+    pipeline = LaneFindingPipeline()
+    n_frames = 0
+
+    def process_frame(image):
+        nonlocal n_frames
+        n_frames += 1
+        return pipeline(image)
+
+    tic = time.perf_counter()
+    clip = VideoFileClip(input_path)
+    clip.fl_image(process_frame).write_videofile(output_path, audio=False, logger=None)
+    clip.close()
+    return input_path, n_frames, time.perf_counter() - tic
+
+
+def analyze_video(input_path, output_path):
+    """
+    Finds the lane lines in all frames of `input_path` without rendering them
+    and writes them to the record store `output_path`. Frames are decoded with
+    OpenCV into a single reused buffer.
+
+    Returns (input_path, number of frames, runtime in seconds).
+    """
+    import cv2
+    from lane_records import LaneRecordWriter
+    from lane_core import LaneFindingPipeline
+
+    pipeline = LaneFindingPipeline()
+    n_frames = 0
+    tic = time.perf_counter()
+    capture = cv2.VideoCapture(input_path)
+    if not capture.isOpened():
+        raise IOError('Cannot open video: {}'.format(input_path))
+    frame = None
+    with LaneRecordWriter(output_path) as writer:
+        while True:
+            ok, frame = capture.read(frame)
+            if not ok:
+                break
+            pipeline.detect(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame))
+            writer.write(pipeline.record(n_frames))
+            n_frames += 1
+        capture.release()
+        if n_frames == 0:
+            raise IOError('Cannot decode video: {}'.format(input_path))
+    return input_path, n_frames, time.perf_counter() - tic
+
+
+def process_video_chunk(input_path, output_path, start_frame, end_frame, warmup=None):
+    """
+    Runs the lane finding pipeline over frames [`start_frame`, `end_frame`) of
+    `input_path` and writes them to `output_path`; `end_frame` None means up
+    to the end of the video.
+
+    The moving averages are first rebuilt from the `warmup` frames before
+    `start_frame` (the LaneTracker history size if None), whose results are
+    discarded. The lane lines then match serial processing exactly as long as
+    each of those frames detects both lane lines; otherwise they differ only
+    until the chunk has seen a full history of detections per side.
+
+    Returns (input_path, number of frames including warm-up, runtime in seconds).
+    """
+    from moviepy.editor import VideoFileClip
+    from lane_core import LaneFindingPipeline
+
+    pipeline = LaneFindingPipeline()
+    if warmup is None:
+        warmup = pipeline.tracker.size
+    n_frames = 0
+
+    def process_frame(image):
+        nonlocal n_frames
+        n_frames += 1
+        return pipeline(image)
+
+    tic = time.perf_counter()
+    clip = VideoFileClip(input_path)
+    for index in range(max(0, start_frame - warmup), start_frame):
+        process_frame(clip.get_frame(index / clip.fps))
+    end_time = None if end_frame is None else end_frame / clip.fps
+    chunk = clip.subclip(start_frame / clip.fps, end_time)
+    chunk.fl_image(process_frame).write_videofile(output_path, audio=False, logger=None)
+    clip.close()
+    return input_path, n_frames, time.perf_counter() - tic
+
+
+def concatenate_videos(chunk_paths, output_path):
+    """
+    Joins the videos `chunk_paths`, encoded with the same settings, into
+    `output_path` with ffmpeg's concat demuxer, without re-encoding.
+    """
+    from moviepy.config import get_setting
+
+    list_path = output_path + '.chunks.txt'
+    with open(list_path, 'w') as list_file:
+        for chunk_path in chunk_paths:
+            list_file.write("file '{}'\n".format(os.path.abspath(chunk_path).replace("'", "'\\''")))
+    try:
+        subprocess.run([get_setting('FFMPEG_BINARY'), '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+                        '-i', list_path, '-c', 'copy', output_path], check=True)
+    finally:
+        os.remove(list_path)
+
+
+def process_video_chunked(input_path, output_path, chunks, jobs=None, warmup=None):
+    """
+    Splits `input_path` into `chunks` time chunks, processes them in parallel
+    on `jobs` worker processes with process_video_chunk() and stitches the
+    results into `output_path`.
+
+    Returns (input_path, number of frames, runtime in seconds), where the
+    frame count does not include the warm-up frames.
+    """
+    from moviepy.editor import VideoFileClip
+
+    tic = time.perf_counter()
+    clip = VideoFileClip(input_path)
+    n_frames = clip.reader.nframes
+    clip.close()
+    chunks = max(1, min(chunks, n_frames))
+    bounds = [n_frames * k // chunks for k in range(chunks)] + [None]
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_path))) as chunk_dir:
+        chunk_paths = [os.path.join(chunk_dir, 'chunk{:04d}.mp4'.format(k)) for k in range(chunks)]
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(process_video_chunk, input_path, chunk_path, bounds[k], bounds[k + 1], warmup)
+                       for k, chunk_path in enumerate(chunk_paths)]
+            for future in futures:
+                future.result()
+        concatenate_videos(chunk_paths, output_path)
+    return input_path, n_frames, time.perf_counter() - tic
+
+
+def process_videos(videos, output_dir, jobs=None, chunks=None, warmup=None, analyze=False):
+    """
+    Processes `videos` in parallel on `jobs` worker processes (all cores if
+    None), writing each result into `output_dir` under the same file name, or
+    with `analyze`, the lane lines of each as a record store named after it
+    with extension .lanes (see analyze_video()). If `chunks` is given, the videos are processed one after another instead,
+    each split into `chunks` time chunks with `warmup` frames of overlap that
+    are processed in parallel (see process_video_chunked()).
+
+    A video that fails is reported and does not stop the batch. Prints frames
+    per second for each video as it finishes and for the whole batch, and
+    returns (a list of (input_path, frames, runtime) per processed video, a
+    list of (input_path, error) per failed video).
+    """
+    if analyze and chunks:
+        raise ValueError('Videos are analyzed whole, not in chunks')
+    os.makedirs(output_dir, exist_ok=True)
+    if analyze:
+        outputs = [os.path.join(output_dir, os.path.splitext(os.path.basename(video))[0] + '.lanes')
+                   for video in videos]
+    else:
+        outputs = [os.path.join(output_dir, os.path.basename(video)) for video in videos]
+    for video, output in zip(videos, outputs):
+        if os.path.abspath(video) == os.path.abspath(output):
+            raise ValueError('Output would overwrite input video: {}'.format(video))
+    if len(set(outputs)) != len(outputs):
+        raise ValueError('Input videos with the same file name would overwrite each other in {}'.format(output_dir))
+
+    results = []
+    failures = []
+
+    def report_failure(video, error):
+        failures.append((video, str(error)))
+        print('{}: {}'.format(video, error), file=sys.stderr)
+
+    tic = time.perf_counter()
+    if chunks:
+        for video, output in zip(videos, outputs):
+            try:
+                video, n_frames, runtime = process_video_chunked(video, output, chunks, jobs, warmup)
+            except Exception as error:
+                report_failure(video, error)
+                continue
+            results.append((video, n_frames, runtime))
+            print('{}: {} frames in {:.2f} s, {:.1f} fps ({} chunks)'.format(
+                video, n_frames, runtime, n_frames / runtime, chunks))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(analyze_video if analyze else process_video, video, output): video
+                       for video, output in zip(videos, outputs)}
+            for future in as_completed(futures):
+                try:
+                    video, n_frames, runtime = future.result()
+                except Exception as error:
+                    report_failure(futures[future], error)
+                    continue
+                results.append((video, n_frames, runtime))
+                print('{}: {} frames in {:.2f} s, {:.1f} fps'.format(video, n_frames, runtime, n_frames / runtime))
+    wall_time = time.perf_counter() - tic
+
+    total_frames = sum(n_frames for _, n_frames, _ in results)
+    cpu_time = sum(runtime for _, _, runtime in results)
+    print('total: {} videos ({} failed), {} frames in {:.2f} s, {:.1f} fps ({:.1f} fps per worker)'.format(
+        len(results) + len(failures), len(failures), total_frames, wall_time, total_frames / wall_time,
+        total_frames / cpu_time if cpu_time else 0.))
+    return results, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Find lane lines in a batch of videos in parallel.')
+    parser.add_argument('inputs', nargs='+', help='video files or directories of videos')
+    parser.add_argument('-o', '--output-dir', default='test_videos_output',
+                        help='directory to write the processed videos to (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: number of cores)')
+    parser.add_argument('--chunks', type=int, default=None,
+                        help='split each video into this many time chunks processed in parallel')
+    parser.add_argument('--warmup', type=int, default=None,
+                        help='frames before each chunk used to rebuild the moving averages '
+                             '(default: the moving average history size)')
+    parser.add_argument('--analyze', action='store_true',
+                        help='write the lane lines of every frame as records instead of videos')
+    args = parser.parse_args(argv)
+
+    videos = find_videos(args.inputs)
+    if not videos:
+        parser.error('no videos found in {}'.format(' '.join(args.inputs)))
+    if args.analyze and args.chunks:
+        parser.error('--analyze and --chunks cannot be combined')
+    _, failures = process_videos(videos, args.output_dir, args.jobs, args.chunks, args.warmup, args.analyze)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+# coding: utf-8
+
+# Parameter sweeps of the lane finding pipeline over test videos.
+#
+# Usage:
+#   python sweep.py test_videos/ low_threshold=40,60,80 high_threshold=100,120,160 threshold=30,50
+#   python sweep.py test_videos/solidWhiteRight.mp4 --random 20 --seed 1 \
+#       min_line_length=15,25,40 max_line_gap=50,100,150 min_pos_slope=0.4,0.5 max_neg_slope=-0.4,-0.5
+#
+# Every parameter not given keeps its value from lane_core.default_parameters. The
+# configurations are the grid of all given values, or a random sample of it
+# with --random. The frames of each video are split into chunks evaluated on a
+# pool of worker processes, each chunk for all configurations at once, so that
+# intermediate images are shared: the grayscale frame by all configurations,
+# the blurred frame by those with the same kernel size, the edges by those with
+# the same Canny parameters too, and the Hough segments by those that differ
+# in their slope bands and lane line fits only.
+#
+# The configurations are ranked by the stability of the lane lines they find
+# (see rank()), then by their time per frame.
+
+import argparse
+import itertools
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# a lane line that is lost counts as a jump of this many pixels
+MISS_PENALTY_PX = 50.
+
+
+def parse_space(assignments):
+    """
+    Returns {parameter: [values]} for `assignments` of the form
+    name=value,value,... with LaneParameters field names. Values are of the
+    type of the parameter's default, except that a parameter with an integer
+    default also takes non-integer values (such as rho=1.5) as floats, but
+    kernel_size must be a positive odd integer, as for cv2.GaussianBlur. Raises
+    ValueError for an unknown parameter or an invalid value.
+    """
+    from lane_core import LaneParameters, default_parameters
+
+    space = {}
+    for assignment in assignments:
+        name, _, values = assignment.partition('=')
+        if name not in LaneParameters._fields or not values:
+            raise ValueError('Expected PARAMETER=VALUE,... with a parameter out of {}, got {}'.format(
+                ', '.join(LaneParameters._fields), assignment))
+        space[name] = [_parse_value(name, value, getattr(default_parameters, name)) for value in values.split(',')]
+    return space
+
+
+def _parse_value(name, value, default):
+    if isinstance(default, str):
+        return value
+    if name == 'kernel_size':
+        try:
+            kernel_size = int(value)
+        except ValueError:
+            kernel_size = None
+        if kernel_size is None or kernel_size <= 0 or kernel_size % 2 == 0:
+            raise ValueError('Expected a positive odd integer for kernel_size, got {}'.format(value))
+        return kernel_size
+    try:
+        if isinstance(default, int):
+            try:
+                return int(value)
+            except ValueError:
+                # promoted, for parameters that OpenCV also takes as floats
+                return float(value)
+        return float(value)
+    except ValueError:
+        raise ValueError('Expected a number for {}, got {}'.format(name, value)) from None
+
+
+def configurations(space, samples=None, seed=None):
+    """
+    Returns the LaneParameters of the grid of `space` ({parameter: [values]}),
+    or of `samples` of them picked at random with `seed`.
+    """
+    from lane_core import default_parameters
+
+    names = list(space)
+    grid = [default_parameters._replace(**dict(zip(names, values)))
+            for values in itertools.product(*(space[name] for name in names))]
+    if samples is not None and samples < len(grid):
+        grid = random.Random(seed).sample(grid, samples)
+    return grid
+
+
+def evaluate_chunk(video, start, end, configs, frame_cache):
+    """
+    Finds the lane lines in frames [`start`, `end`) of `video` with each of
+    `configs`, without tracking them from frame to frame.
+
+    Returns (fits, times): fits is an array of shape (configs, frames, 2, 2)
+    of the (slope, x_mid) of the positive and negative lane side, NaN where a
+    side was not found, and times the seconds per configuration, counting
+    every shared stage it uses as if it had run it alone.
+    """
+    import cv2
+    from frame_cache import FrameCache
+    from lane_core import fit_lanes, hough_segments, lane_roi_top, lane_roi_vertices, roi_mask
+
+    frames = FrameCache(frame_cache).frames(video, 'gray')
+    imshape = frames.shape[1:]
+    mask = roi_mask(imshape, lane_roi_vertices(imshape))
+    y_mid = imshape[0] * 3/4
+    fits = np.full((len(configs), end - start, 2, 2), np.nan)
+    times = np.zeros(len(configs))
+    for index in range(start, end):
+        gray = frames[index]
+        # the intermediate images of this frame, with the seconds each took: {key: (result, seconds)}
+        blurred, edges, segments = {}, {}, {}
+        for c, params in enumerate(configs):
+            kernel_size = params.kernel_size
+            # the rows processed by lane_edge_band() and LaneFindingPipeline
+            top = lane_roi_top(imshape, kernel_size)
+            canny_key = (kernel_size, params.low_threshold, params.high_threshold)
+            hough_key = canny_key + (params.rho, params.theta, params.threshold, params.min_line_length,
+                                     params.max_line_gap)
+            if kernel_size not in blurred:
+                tic = time.perf_counter()
+                blur_gray = cv2.GaussianBlur(gray[top:], (kernel_size, kernel_size), 0)
+                blurred[kernel_size] = (blur_gray, time.perf_counter() - tic)
+            if canny_key not in edges:
+                tic = time.perf_counter()
+                masked_edges = cv2.bitwise_and(cv2.Canny(blurred[kernel_size][0], params.low_threshold,
+                                                         params.high_threshold), mask[top:])
+                edges[canny_key] = ((masked_edges, top), time.perf_counter() - tic)
+            if hough_key not in segments:
+                tic = time.perf_counter()
+                lines = hough_segments(*edges[canny_key][0], params)
+                segments[hough_key] = (lines, time.perf_counter() - tic)
+            tic = time.perf_counter()
+            pos_fit, neg_fit = fit_lanes(segments[hough_key][0], y_mid, params)
+            times[c] += (time.perf_counter() - tic + blurred[kernel_size][1] + edges[canny_key][1] +
+                         segments[hough_key][1])
+            for side, fit in enumerate((pos_fit, neg_fit)):
+                if fit is not None:
+                    fits[c, index - start, side] = fit
+    return fits, times
+
+
+def rank(configs, evaluations):
+    """
+    Returns a result per configuration of `configs`, most stable first and
+    faster first among equally stable ones. `evaluations` is a list of (fits,
+    times, imshape) per video, with fits and times as from evaluate_chunk().
+
+    Stability is measured on the x coordinates of each lane line at the bottom
+    and the top of the region of interest, from frame to frame: jitter is the
+    mean of their changes, and instability the same with a change of
+    MISS_PENALTY_PX for every frame in which the lane line is missing, or was
+    missing in the frame before: when it is lost, as long as it stays lost,
+    and when it is found again.
+    The lane lines are not smoothed from frame to frame for this, so that it
+    measures the detection itself.
+    """
+    jumps, found = [], []
+    times = np.zeros(len(configs))
+    n_frames = 0
+    for fits, video_times, imshape in evaluations:
+        ys = np.array([imshape[0] - 1, int(imshape[0] * 5 / 8)]) - imshape[0] * 3 / 4
+        slopes, x_mids = fits[..., 0], fits[..., 1]
+        # (configs, frames, sides, bottom and top)
+        xs = x_mids[..., np.newaxis] + ys / slopes[..., np.newaxis]
+        jumps.append(np.abs(np.diff(xs, axis=1)).reshape(len(configs), -1))
+        found.append(~np.isnan(slopes).reshape(len(configs), -1))
+        times += video_times
+        n_frames += fits.shape[1]
+    jumps = np.concatenate(jumps, axis=1)
+    found = np.concatenate(found, axis=1)
+    missed = np.isnan(jumps)
+    instability = np.where(missed, MISS_PENALTY_PX, jumps).mean(axis=1)
+    jitter = np.where(missed, 0., jumps).sum(axis=1) / np.maximum(1, (~missed).sum(axis=1))
+    results = [{'params': params._asdict(), 'instability_px': float(instability[c]), 'jitter_px': float(jitter[c]),
+                'found': float(found[c].mean()), 'ms_per_frame': float(times[c] / n_frames * 1e3)}
+               for c, params in enumerate(configs)]
+    return sorted(results, key=lambda result: (round(result['instability_px'], 2), result['ms_per_frame']))
+
+
+def sweep(videos, configs, jobs=None, frame_cache='.frame_cache'):
+    """
+    Evaluates `configs` over all frames of `videos` on `jobs` worker processes
+    (all cores if None) and returns their ranked results (see rank()).
+    """
+    from frame_cache import FrameCache
+
+    jobs = jobs or os.cpu_count()
+    cache = FrameCache(frame_cache)
+    evaluations = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for video in videos:
+            # decoded into the cache once, before the workers read from it
+            n_frames, *imshape = cache.frames(video, 'gray').shape
+            bounds = [n_frames * k // jobs for k in range(jobs + 1)]
+            futures = [executor.submit(evaluate_chunk, video, start, end, configs, frame_cache)
+                       for start, end in zip(bounds, bounds[1:]) if end > start]
+            chunks = [future.result() for future in futures]
+            evaluations.append((np.concatenate([fits for fits, _ in chunks], axis=1),
+                                sum(times for _, times in chunks), imshape))
+    return rank(configs, evaluations)
+
+
+def main(argv=None):
+    from process_videos import find_videos
+
+    parser = argparse.ArgumentParser(description='Sweep the lane finding parameters over test videos.')
+    parser.add_argument('inputs', nargs='+', help='video files or directories of videos, then PARAMETER=VALUE,...')
+    parser.add_argument('--random', type=int, metavar='N', default=None,
+                        help='evaluate N configurations picked at random from the grid')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the random pick')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes (default: number of cores)')
+    parser.add_argument('--frame-cache', metavar='DIR', default='.frame_cache',
+                        help='where the decoded frames are cached (default: %(default)s)')
+    parser.add_argument('--top', type=int, default=10, help='configurations to print (default: %(default)s)')
+    parser.add_argument('--save', metavar='PATH', default=None, help='write all ranked results to PATH as JSON')
+    args = parser.parse_args(argv)
+
+    paths = [arg for arg in args.inputs if '=' not in arg]
+    try:
+        space = parse_space([arg for arg in args.inputs if '=' in arg])
+    except ValueError as error:
+        parser.error(str(error))
+    videos = find_videos(paths)
+    if not videos:
+        parser.error('no videos found in {}'.format(' '.join(paths)))
+    configs = configurations(space, args.random, args.seed)
+    tic = time.perf_counter()
+    results = sweep(videos, configs, args.jobs, args.frame_cache)
+    print('{} configurations over {} videos in {:.1f} s'.format(len(configs), len(videos), time.perf_counter() - tic))
+    names = list(space) or ['kernel_size', 'low_threshold', 'high_threshold']
+    for result in results[:args.top]:
+        print('{:7.2f} px instability {:6.2f} px jitter {:5.1%} found {:6.2f} ms/frame  {}'.format(
+            result['instability_px'], result['jitter_px'], result['found'], result['ms_per_frame'],
+            ' '.join('{}={}'.format(name, result['params'][name]) for name in names)))
+    if args.save:
+        with open(args.save, 'w') as results_file:
+            json.dump(results, results_file, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+# coding: utf-8
+
+# The modules live at the repository root, next to P1.py.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,40 @@
+# coding: utf-8
+
+import os
+
+import numpy as np
+import pytest
+
+from frame_cache import FrameCache
+
+VIDEO = os.path.join(os.path.dirname(__file__), '..', 'test_videos', 'solidWhiteRight.mp4')
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return FrameCache(str(tmp_path / 'cache'))
+
+
+def test_miss_then_hit(cache, monkeypatch):
+    gray = cache.frames(VIDEO, 'gray')
+    assert gray.ndim == 3 and len(gray) > 0
+    assert sorted(os.listdir(cache.path)) == sorted(name for _, _, entry in cache.entries()
+                                                    for name in (entry + '.json', entry + '.frames'))
+
+    def decode(*args):
+        raise AssertionError('decoded a cached video')
+
+    monkeypatch.setattr(cache, '_decode', decode)
+    np.testing.assert_array_equal(cache.frames(VIDEO, 'gray'), gray)
+    # another kind of frames is another entry
+    with pytest.raises(AssertionError):
+        cache.frames(VIDEO, 'blur', kernel_size=3)
+
+
+def test_eviction_keeps_entry_in_use(cache):
+    cache.max_bytes = 1
+    gray = cache.frames(VIDEO, 'gray')
+    rgb = cache.frames(VIDEO, 'rgb')
+    [(_, size, name)] = cache.entries()
+    assert name.endswith('_rgb') and size == rgb.nbytes
+    assert cache.frames(VIDEO, 'gray').shape == gray.shape
@@ -0,0 +1,143 @@
+# coding: utf-8
+
+import glob
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import lane_core
+
+TEST_IMAGES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), '..', 'test_images', '*.jpg')))
+
+
+def read_rgb(path):
+    return cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2RGB)
+
+
+@pytest.mark.parametrize('path', TEST_IMAGES)
+def test_hough_segments_in_frame_coordinates(path):
+    image = read_rgb(path)
+    edges, top = lane_core.lane_edge_band(image)
+    assert edges.shape == (image.shape[0] - top, image.shape[1])
+    segments = lane_core.hough_segments(edges, top)
+    assert segments is not None
+    assert segments[..., 1::2].min() >= top
+    assert segments[..., 1::2].max() < image.shape[0]
+
+
+def test_lane_edges_full_size():
+    image = read_rgb(TEST_IMAGES[0])
+    edges, top = lane_core.lane_edge_band(image)
+    full = lane_core.lane_edges(image)
+    assert full.shape == image.shape[:2]
+    assert not full[:top].any()
+    np.testing.assert_array_equal(full[top:], edges)
+
+
+def test_pipeline_matches_reference():
+    pipeline = lane_core.LaneFindingPipeline()
+    for path in TEST_IMAGES:
+        image = read_rgb(path)
+        pipeline.reset()
+        np.testing.assert_array_equal(pipeline(image), lane_core.lane_finding_pipeline(image, lane_core.LaneTracker()))
+
+
+def test_adaptive_roi_widens_when_kalman_only_predicts():
+    image = read_rgb(TEST_IMAGES[0])
+    pipeline = lane_core.LaneFindingPipeline(lane_core.KalmanLaneTracker(), adaptive_roi=True)
+    for _ in range(3):
+        pipeline.detect(image)
+    assert pipeline.measured == {'pos', 'neg'}
+    assert pipeline.narrowed_frames > 0
+    # no edges at all: both lane lines are only predicted
+    pipeline.detect(np.full_like(image, 128))
+    assert pipeline.measured == set()
+    assert len(lane_core.lane_line_sides(pipeline.lines)) == 2
+    pipeline.detect(image)
+    assert pipeline.narrowed_frames == 0
+
+
+def test_redraw_after_detect_matches_call():
+    drawn, detected = lane_core.LaneFindingPipeline(), lane_core.LaneFindingPipeline()
+    for path in TEST_IMAGES:
+        image = read_rgb(path)
+        detected.detect(image)
+        np.testing.assert_array_equal(detected.redraw(image), drawn(image))
+
+
+def line_segments(slope, x_mid, y_mid, ys):
+    # segments between consecutive ys on the line of `slope` through (x_mid, y_mid)
+    xs = x_mid + (np.asarray(ys, dtype=np.float64) - y_mid) / slope
+    return np.array([[xs[i], ys[i], xs[i + 1], ys[i + 1]] for i in range(len(ys) - 1)]).round().astype(np.int32)
+
+
+def test_weighted_line_fit_on_line():
+    segments = line_segments(0.6, 700., 405., [340, 380, 400, 460, 539])
+    slope, x_mid = lane_core.weighted_line_fit(segments, 405.)
+    assert slope == pytest.approx(0.6, abs=0.005)
+    assert x_mid == pytest.approx(700., abs=1.)
+
+
+def test_weighted_line_fit_weights_long_segments():
+    segments = np.concatenate([line_segments(0.6, 700., 405., [340, 539]),
+                               line_segments(0.7, 720., 405., [400, 410])])
+    slope, x_mid = lane_core.weighted_line_fit(segments, 405.)
+    assert slope == pytest.approx(0.6, abs=0.01)
+    assert x_mid == pytest.approx(700., abs=3.)
+
+
+def test_weighted_line_fit_vertical():
+    assert lane_core.weighted_line_fit(np.array([[500, 340, 500, 400], [500, 420, 500, 539]]), 405.) is None
+
+
+def test_ransac_line_fit_ignores_outliers():
+    inliers = line_segments(-0.7, 250., 405., [540, 500, 470, 420, 380, 340])
+    outliers = line_segments(-0.55, 150., 405., [520, 470, 420])
+    segments = np.concatenate([inliers, outliers])
+    lsq_slope, lsq_x_mid = lane_core.weighted_line_fit(segments, 405.)
+    slope, x_mid = lane_core.ransac_line_fit(segments, 405.)
+    assert slope == pytest.approx(-0.7, abs=0.005)
+    assert x_mid == pytest.approx(250., abs=1.)
+    assert abs(lsq_x_mid - 250.) > 10 * abs(x_mid - 250.)
+
+
+def test_ransac_line_fit_without_outliers_matches_lsq():
+    segments = line_segments(0.6, 700., 405., [340, 380, 400, 460, 539])
+    np.testing.assert_allclose(lane_core.ransac_line_fit(segments, 405.), lane_core.weighted_line_fit(segments, 405.))
+
+
+@pytest.mark.parametrize('fit', ['lsq', 'ransac'])
+def test_fit_lanes_keeps_slope_in_band(fit):
+    # both in the positive band, but far apart: a line through their endpoints slopes the other way
+    segments = np.array([[[100, 500, 150, 530]], [[900, 400, 950, 430]]], dtype=np.int32)
+    params = lane_core.default_parameters._replace(fit=fit)
+    pos_fit, neg_fit = lane_core.fit_lanes(segments, 405., params)
+    assert params.min_pos_slope <= pos_fit[0] <= params.max_pos_slope
+    assert neg_fit is None
+    lines = lane_core.lane_lines_from_fits({'pos': pos_fit, 'neg': neg_fit}, (540, 960, 3))
+    assert list(lane_core.lane_line_sides(lines)) == ['pos']
+
+
+def test_star_import_exports_public_names():
+    namespace = {}
+    exec('from lane_core import *', namespace)
+    exported = set(namespace) - {'__builtins__'}
+    assert exported == set(lane_core.__all__)
+    assert not {'np', 'cv2', 'csv', 'json', 'math', 'time', '_roi_mask'} & exported
+    assert {'LaneFindingPipeline', 'lane_finding_pipeline', 'LaneParameters'} <= exported
+
+
+def test_realtime_records_mark_redrawn_frames():
+    image = read_rgb(TEST_IMAGES[0])
+    realtime = lane_core.RealTimePipeline(budget=1e-6, max_skip=4)
+    detected = []
+    for frame in range(8):
+        realtime(image)
+        detected.append(bool(realtime.record(frame)['detected']))
+    assert detected[0] and not all(detected)
+    assert sum(detected) == realtime.detections
+    pipeline = lane_core.LaneFindingPipeline()
+    pipeline.detect(image)
+    assert pipeline.record()['detected']
@@ -0,0 +1,46 @@
+# coding: utf-8
+
+import os
+
+import numpy as np
+import pytest
+
+from lane_core import LANE_RECORD_DTYPE
+from lane_records import META_FILE, LaneRecords, LaneRecordWriter
+
+
+def make_records(count):
+    records = np.zeros(count, dtype=LANE_RECORD_DTYPE)
+    records['frame'] = np.arange(count)
+    records['segments'] = np.arange(count) % 7
+    records['pos_slope'] = np.linspace(0.5, 0.7, count)
+    records['neg_x1'] = np.nan
+    return records
+
+
+def test_round_trip(tmp_path):
+    records = make_records(10)
+    path = str(tmp_path / 'video.lanes')
+    # a chunk smaller than the records, to append several
+    with LaneRecordWriter(path, chunk_size=4) as writer:
+        for record in records[:3]:
+            writer.write(record)
+        writer.write_many(records[3:])
+    stored = LaneRecords(path)
+    assert len(stored) == 10
+    np.testing.assert_array_equal(stored['pos_slope'], records['pos_slope'])
+    assert stored[-1]['frame'] == 9
+    for name in LANE_RECORD_DTYPE.names:
+        np.testing.assert_array_equal(stored.to_array()[name], records[name])
+
+
+def test_interrupted_store_is_incomplete(tmp_path):
+    path = str(tmp_path / 'video.lanes')
+    with pytest.raises(RuntimeError):
+        with LaneRecordWriter(path) as writer:
+            writer.write_many(make_records(5))
+            raise RuntimeError('decoding failed')
+    assert not os.path.exists(os.path.join(path, META_FILE))
+    assert os.path.getsize(os.path.join(path, 'frame.bin')) == 5 * 8
+    with pytest.raises(IOError):
+        LaneRecords(path)
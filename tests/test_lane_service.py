@@ -0,0 +1,55 @@
+# coding: utf-8
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from lane_service import LaneService, SyntheticSource
+
+
+class SlowSource(SyntheticSource):
+    """
+    A synthetic source whose frames take `delay` seconds to read, that records
+    whether it was closed during a read.
+    """
+
+    def __init__(self, delay, **kwargs):
+        super().__init__(width=320, height=180, frames=None, **kwargs)
+        self.delay = delay
+        self.reading = threading.Event()
+        self.closed_while_reading = None
+
+    def __iter__(self):
+        for item in super().__iter__():
+            self.reading.set()
+            time.sleep(self.delay)
+            self.reading.clear()
+            yield item
+
+    def close(self):
+        self.closed_while_reading = self.reading.is_set()
+
+
+@pytest.mark.parametrize('live', [False, True])
+def test_streams_end_after_all_frames(live):
+    lanes = []
+    service = LaneService(jobs=2, on_lanes=lambda name, index, pipeline: lanes.append((name, index)))
+    for name in ('a', 'b'):
+        service.add_stream(name, SyntheticSource(320, 180, frames=12, seed=0), live=live)
+    stats = asyncio.run(service.run())
+    for name in ('a', 'b'):
+        assert stats[name]['read'] == 12
+        assert stats[name]['processed'] + stats[name]['dropped'] == 12
+        indexes = [index for stream, index in lanes if stream == name]
+        assert indexes == sorted(indexes) and indexes[-1] == 11
+
+
+def test_cancelled_service_closes_sources_after_reads():
+    source = SlowSource(0.05, seed=0)
+    service = LaneService(jobs=1)
+    service.add_stream('slow', source)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(asyncio.wait_for(service.run(), timeout=0.12))
+    assert source.closed_while_reading is False
@@ -0,0 +1,42 @@
+# coding: utf-8
+
+import numpy as np
+import pytest
+
+from lane_stream import stream
+
+
+class CountingSource():
+    def __init__(self, frames):
+        self.frames = frames
+        self.read = 0
+        self.closed = False
+
+    def __iter__(self):
+        for index in range(self.frames):
+            self.read += 1
+            yield '{:06d}'.format(index), np.zeros((4, 4, 3), dtype=np.uint8)
+
+    def close(self):
+        self.closed = True
+
+
+class ListSink():
+    def __init__(self):
+        self.names = []
+
+    def write(self, name, frame):
+        self.names.append(name)
+
+    def close(self):
+        pass
+
+
+@pytest.mark.parametrize('max_frames, expected', [(None, 10), (3, 3), (0, 0)])
+def test_max_frames_reads_no_extra_frame(max_frames, expected):
+    source, sink = CountingSource(10), ListSink()
+    n_frames, _ = stream(source, sink, lambda frame: frame, queue_size=2, max_frames=max_frames)
+    assert n_frames == expected
+    assert source.read == expected
+    assert sink.names == ['{:06d}'.format(index) for index in range(expected)]
+    assert source.closed
@@ -0,0 +1,54 @@
+# coding: utf-8
+
+import csv
+import glob
+import os
+import shutil
+
+import pytest
+
+from process_images import find_images, process_images
+
+TEST_IMAGE = sorted(glob.glob(os.path.join(os.path.dirname(__file__), '..', 'test_images', '*.jpg')))[0]
+
+
+@pytest.fixture
+def dashcam(tmp_path):
+    for folder in ('a', 'b'):
+        (tmp_path / 'dashcam' / folder).mkdir(parents=True)
+        shutil.copy(TEST_IMAGE, tmp_path / 'dashcam' / folder / '0001.jpg')
+    return tmp_path / 'dashcam'
+
+
+def test_find_images_relative_to_pattern(dashcam):
+    images = list(find_images([str(dashcam / '**' / '*.jpg')]))
+    assert [relative_path for _, relative_path in images] == [os.path.join('a', '0001.jpg'),
+                                                             os.path.join('b', '0001.jpg')]
+    images = list(find_images([str(dashcam / 'a')]))
+    assert images == [(str(dashcam / 'a' / '0001.jpg'), '0001.jpg')]
+
+
+def test_same_file_names_in_subdirectories(dashcam, tmp_path):
+    output_dir = tmp_path / 'output'
+    n_images, n_failed, _ = process_images(find_images([str(dashcam / '**' / '*.jpg')]), str(output_dir), jobs=2)
+    assert (n_images, n_failed) == (2, 0)
+    assert (output_dir / 'a' / '0001.jpg').is_file()
+    assert (output_dir / 'b' / '0001.jpg').is_file()
+    with open(output_dir / 'lanes.csv') as csv_file:
+        assert len({row['image'] for row in csv.DictReader(csv_file)}) == 2
+
+
+def test_duplicate_outputs_rejected(dashcam, tmp_path):
+    with pytest.raises(ValueError):
+        process_images(find_images([str(dashcam / 'a'), str(dashcam / 'b')]), str(tmp_path / 'output'))
+    assert not (tmp_path / 'output').exists()
+
+
+def test_output_over_input_rejected(dashcam):
+    with open(dashcam / 'a' / '0001.jpg', 'rb') as image_file:
+        original = image_file.read()
+    with pytest.raises(ValueError):
+        process_images(find_images([str(dashcam / 'a')]), str(dashcam / 'a'))
+    with open(dashcam / 'a' / '0001.jpg', 'rb') as image_file:
+        assert image_file.read() == original
+    assert not (dashcam / 'a' / 'lanes.csv').exists()
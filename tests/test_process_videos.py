@@ -0,0 +1,33 @@
+# coding: utf-8
+
+import os
+import shutil
+
+import pytest
+
+from process_videos import find_videos, process_videos
+
+VIDEO = os.path.join(os.path.dirname(__file__), '..', 'test_videos', 'solidWhiteRight.mp4')
+
+
+@pytest.fixture
+def videos(tmp_path):
+    shutil.copy(VIDEO, tmp_path / 'good.mp4')
+    with open(VIDEO, 'rb') as video_file:
+        (tmp_path / 'corrupt.mp4').write_bytes(video_file.read(5000))
+    return tmp_path
+
+
+def test_failed_video_does_not_stop_batch(videos, tmp_path):
+    results, failures = process_videos(find_videos([str(videos)]), str(tmp_path / 'out'), jobs=1, analyze=True)
+    assert [video for video, _, _ in results] == [str(videos / 'good.mp4')]
+    assert results[0][1] > 0
+    assert [video for video, _ in failures] == [str(videos / 'corrupt.mp4')]
+
+
+def test_duplicate_file_names_rejected(tmp_path):
+    for folder in ('a', 'b'):
+        (tmp_path / folder).mkdir()
+        shutil.copy(VIDEO, tmp_path / folder / 'clip.mp4')
+    with pytest.raises(ValueError):
+        process_videos([str(tmp_path / 'a' / 'clip.mp4'), str(tmp_path / 'b' / 'clip.mp4')], str(tmp_path / 'out'))
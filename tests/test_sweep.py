@@ -0,0 +1,43 @@
+# coding: utf-8
+
+import pytest
+
+from sweep import main, parse_space
+
+
+def test_values_take_the_type_of_the_default():
+    space = parse_space(['low_threshold=40,60', 'ransac_threshold=15', 'fit=average,lsq'])
+    assert space == {'low_threshold': [40, 60], 'ransac_threshold': [15.], 'fit': ['average', 'lsq']}
+    assert type(space['low_threshold'][0]) is int
+    assert type(space['ransac_threshold'][0]) is float
+
+
+def test_kernel_sizes():
+    assert parse_space(['kernel_size=3,5,7']) == {'kernel_size': [3, 5, 7]}
+
+
+def test_integer_parameter_takes_floats():
+    space = parse_space(['rho=1,1.5'])
+    assert space == {'rho': [1, 1.5]}
+    assert [type(value) for value in space['rho']] == [int, float]
+
+
+@pytest.mark.parametrize('assignment', ['rho=fine', 'unknown=1', 'threshold=', 'threshold=30,,50', 'kernel_size=4',
+                                        'kernel_size=0', 'kernel_size=-3', 'kernel_size=5.5', 'kernel_size=3,6'])
+def test_invalid_assignments(assignment):
+    with pytest.raises(ValueError):
+        parse_space([assignment])
+
+
+def test_main_reports_invalid_assignment(capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        main(['test_videos', 'rho=fine'])
+    assert exit_info.value.code == 2
+    assert 'Expected a number for rho, got fine' in capsys.readouterr().err
+
+
+def test_main_reports_invalid_kernel_size(capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        main(['test_videos', 'kernel_size=4'])
+    assert exit_info.value.code == 2
+    assert 'positive odd integer for kernel_size, got 4' in capsys.readouterr().err